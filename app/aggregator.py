@@ -0,0 +1,215 @@
+import asyncio
+import time
+import exchange
+from config import AGGREGATE_SYMBOLS, AGGREGATE_INTERVALS
+from kline_cache import kline_cache, INTERVAL_MS, MAX_KLINES_PER_REQUEST, stream_kline_to_row
+from logger import logger
+
+BASE_INTERVAL = "1m"
+BASE_MS = INTERVAL_MS[BASE_INTERVAL]
+
+
+def _start_bar(open_time, interval_ms, row):
+    """Старшая свеча из первой минутной свечи периода (формат REST, числа как float)"""
+    return [open_time, float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]),
+            open_time + interval_ms - 1, float(row[7]), int(row[8]), float(row[9]), float(row[10]), "0"]
+
+
+def _fold(bar, row):
+    """Старшая свеча bar, дополненная следующей минутной свечой row; bar не меняется"""
+    return [bar[0], bar[1], max(bar[2], float(row[2])), min(bar[3], float(row[3])), float(row[4]),
+            bar[5] + float(row[5]), bar[6], bar[7] + float(row[7]), bar[8] + int(row[8]),
+            bar[9] + float(row[9]), bar[10] + float(row[10]), "0"]
+
+
+class _Period:
+    """Текущая старшая свеча: свёртка закрытых минут и последняя (незакрытая) минута"""
+
+    __slots__ = ("interval", "interval_ms", "open_time", "closed", "current")
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.open_time = None
+        self.closed = None   # Свёртка закрытых минут периода
+        self.current = None  # Свёртка вместе с формирующейся минутой — то, что видят потребители
+
+    def apply(self, row, closed):
+        """
+        Учитывает минутную свечу. Возвращает (закрывшаяся свеча прошлого периода или None,
+        текущая свеча периода).
+        """
+        open_time = row[0] - row[0] % self.interval_ms
+        finished = None
+        if open_time != self.open_time:
+            finished = self.current
+            self.open_time = open_time
+            self.closed = None
+        bar = _start_bar(open_time, self.interval_ms, row) if self.closed is None else _fold(self.closed, row)
+        if closed:
+            self.closed = bar
+        self.current = bar
+        return finished, bar
+
+
+class CandleAggregator:
+    """
+    Старшие таймфреймы из одного минутного потока свечей.
+    Каждое обновление минутной свечи (раз в 1-2 секунды) сворачивается в текущие
+    свечи 5m/15m/1h/... и кладётся в kline_cache, поэтому кэш по этим парам
+    не ходит в REST, пока поток жив, а новая старшая свеча видна сразу после закрытия.
+    На старте история каждого таймфрейма загружается один раз, текущие периоды
+    досчитываются по минутным свечам. При пропуске минут (переподключение потока)
+    или после восстановления из снимка докачиваются только недостающие минуты,
+    если самый длинный период ещё не сменился, иначе периоды пересобираются заново.
+    """
+
+    def __init__(self, symbol, intervals=AGGREGATE_INTERVALS, cache=kline_cache):
+        self.symbol = symbol
+        self.cache = cache
+        self.periods = [_Period(interval) for interval in intervals]
+        self.last_closed = None  # open_time последней закрытой минуты
+        self.loop = None
+        self.subscription = None
+        self._seeding = None     # Сообщения, пришедшие во время загрузки истории
+        self._seed_task = None
+
+    @property
+    def intervals(self):
+        return [period.interval for period in self.periods]
+
+    def bar(self, interval):
+        """Текущая (незакрытая) свеча таймфрейма в формате REST или None"""
+        for period in self.periods:
+            if period.interval == interval:
+                return period.current
+        return None
+
+    def start(self, stream_manager):
+        """Подписывается на минутные свечи и загружает историю. Вызывать из event loop."""
+        self.loop = asyncio.get_running_loop()
+        self._seeding = []
+        # Колбэк в потоке WebSocket без схлопывания: закрытие минуты терять нельзя
+        self.subscription = stream_manager.subscribe(f"{self.symbol.lower()}@kline_{BASE_INTERVAL}",
+                                                     callback=self._on_kline)
+        self._seed_task = asyncio.create_task(self._seed())
+
+    def export(self):
+        """Состояние для снимка или None, пока идёт загрузка истории"""
+        if self._seeding is not None or self.last_closed is None:
+            return None
+        return {"intervals": self.intervals, "last_closed": self.last_closed,
+                "periods": [(period.open_time, period.closed, period.current) for period in self.periods]}
+
+    def restore(self, state):
+        """Состояние из снимка (до start); снимок с другим набором таймфреймов не подходит"""
+        if state["intervals"] != self.intervals:
+            return False
+        for period, (open_time, closed, current) in zip(self.periods, state["periods"]):
+            period.open_time, period.closed, period.current = open_time, closed, current
+        self.last_closed = state["last_closed"]
+        return True
+
+    def _on_kline(self, msg):
+        k = msg["k"]
+        self.loop.call_soon_threadsafe(self.on_kline, stream_kline_to_row(k), k["x"])
+
+    def on_kline(self, row, closed):
+        """Обновление минутной свечи из потока (в event loop)"""
+        if self._seeding is not None:
+            self._seeding.append((row, closed))
+            return
+        if self.last_closed is not None and row[0] - BASE_MS > self.last_closed:
+            logger.warning(f"Агрегатор {self.symbol}: пропущены минутные свечи, докачиваем")
+            self._seeding = [(row, closed)]
+            self._seed_task = asyncio.create_task(self._seed(prime=False))
+            return
+        self._apply(row, closed)
+
+    def _apply(self, row, closed):
+        if self.last_closed is not None and row[0] <= self.last_closed:
+            return  # Уже учтена (повтор после загрузки истории)
+        if closed:
+            self.last_closed = row[0]
+        self.cache.update(self.symbol, BASE_INTERVAL, row)
+        for period in self.periods:
+            finished, bar = period.apply(row, closed)
+            if finished is not None:
+                self.cache.update(self.symbol, period.interval, finished)
+            self.cache.update(self.symbol, period.interval, bar)
+
+    async def _seed(self, prime=True):
+        """
+        Загружает историю: один раз по каждому таймфрейму в кэш (prime),
+        и минутные свечи с начала самого длинного текущего периода —
+        или только после последней учтённой минуты, если этот период ещё идёт.
+        """
+        try:
+            longest = max(period.interval_ms for period in self.periods)
+            now_ms = int(time.time() * 1000)
+            start = now_ms - now_ms % longest
+            resume = self.last_closed is not None and self.last_closed + BASE_MS >= start
+            if resume:
+                start = self.last_closed + BASE_MS
+            elif prime:
+                # После восстановления из снимка история таймфреймов уже в кэше и дополнится из минут
+                for interval in [BASE_INTERVAL] + self.intervals:
+                    await self.cache.get(self.symbol, interval, 1)
+            rows = []
+            while True:
+                page = await exchange.get_klines(self.symbol, BASE_INTERVAL, MAX_KLINES_PER_REQUEST, startTime=start)
+                rows.extend(page)
+                if len(page) < MAX_KLINES_PER_REQUEST:
+                    break
+                start = page[-1][0] + BASE_MS
+
+            if not resume:
+                for period in self.periods:
+                    period.open_time = period.closed = period.current = None
+                self.last_closed = None
+            now_ms = time.time() * 1000
+            for row in rows:
+                self._apply(row, row[6] < now_ms)
+            if resume:
+                logger.info(f"Агрегатор {self.symbol}: докачано {len(rows)} минутных свечей")
+            else:
+                logger.info(f"Агрегатор {self.symbol}: {', '.join(self.intervals)} из {len(rows)} минутных свечей")
+        except Exception as e:
+            logger.error(f"Агрегатор {self.symbol}: не удалось загрузить историю: {e}")
+        finally:
+            pending, self._seeding = self._seeding or [], None
+            for row, closed in pending:
+                self.on_kline(row, closed)
+
+
+_aggregators = {}
+
+
+def start_aggregators(stream_manager, symbols=AGGREGATE_SYMBOLS, intervals=AGGREGATE_INTERVALS):
+    """Запускает агрегаторы для пар из конфига (вызывать из event loop)"""
+    for symbol in symbols:
+        aggregator = _aggregators.get(symbol)
+        if aggregator is None:
+            aggregator = _aggregators[symbol] = CandleAggregator(symbol, intervals)
+        if aggregator.subscription is None:
+            aggregator.start(stream_manager)
+    return list(_aggregators.values())
+
+
+def export_aggregators():
+    """Состояние агрегаторов для снимка: {symbol: state}"""
+    states = {symbol: aggregator.export() for symbol, aggregator in _aggregators.items()}
+    return {symbol: state for symbol, state in states.items() if state is not None}
+
+
+def restore_aggregators(states, symbols=AGGREGATE_SYMBOLS, intervals=AGGREGATE_INTERVALS):
+    """Создаёт (не запуская) агрегаторы с состоянием из снимка; start_aggregators докачает разрыв"""
+    for symbol, state in states.items():
+        if symbol in symbols and symbol not in _aggregators:
+            aggregator = CandleAggregator(symbol, intervals)
+            if aggregator.restore(state):
+                _aggregators[symbol] = aggregator
+
+
+def get_aggregator(symbol):
+    return _aggregators.get(symbol)
@@ -0,0 +1,169 @@
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import os
+import kernels
+
+# Колонки свечей в формате Binance (REST get_klines и архивы data.binance.vision)
+KLINE_COLUMNS = ["open_time", "open", "high", "low", "close", "volume", "close_time",
+                 "quote_asset_volume", "number_of_trades", "taker_buy_base", "taker_buy_quote", "ignore"]
+
+
+def load_candles(path):
+    """
+    Загружает свечи из локального файла: CSV в формате Binance (с заголовком или без)
+    или .npz с массивами open_time/open/high/low/close/volume.
+    Путь вида SYMBOL:interval (например BTCUSDT:1m) читается из локального
+    хранилища свечей через memmap, без копирования.
+    :return: dict колонка -> numpy-массив
+    """
+    if ":" in path and not os.path.exists(path):
+        from kline_store import kline_store
+        symbol, interval = path.split(":", 1)
+        return kline_store.open(symbol, interval, ["open_time", "open", "high", "low", "close", "volume"])
+
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    with open(path) as f:
+        has_header = not f.readline().split(",")[0].strip().isdigit()
+    df = pd.read_csv(path, header=0 if has_header else None, usecols=range(6))
+    df.columns = KLINE_COLUMNS[:6]
+    candles = {name: df[name].to_numpy(dtype=np.float64) for name in KLINE_COLUMNS[1:6]}
+    open_time = df["open_time"].to_numpy(dtype=np.int64)
+    if len(open_time) and open_time[0] > 10 ** 14:
+        open_time = open_time // 1000  # В новых архивах Binance время в микросекундах
+    candles["open_time"] = open_time
+    return candles
+
+
+def _positions(entries, exits):
+    """
+    Позиция (0/1) после каждой свечи: вход по entries, выход по exits.
+    Последнее событие протягивается вперёд; если на одной свече оба — вход важнее.
+    """
+    events = np.where(entries, 1.0, np.where(exits, 0.0, np.nan))
+    index = np.where(np.isnan(events), 0, np.arange(len(events)))
+    np.maximum.accumulate(index, out=index)
+    positions = events[index]
+    return np.nan_to_num(positions, nan=0.0)
+
+
+def crash_reversal_signals(candles, drop_threshold=5, period=10, volume_multiplier=1.5, hold=60):
+    """Покупаем на развороте после падения, держим hold свечей после последнего сигнала"""
+    entries = kernels.crash_reversal(candles["close"], candles["volume"], drop_threshold, period, volume_multiplier)
+    # Выход через hold свечей после входа, если за это время не было нового сигнала
+    last_entry = np.where(entries, np.arange(len(entries)), -hold - 1)
+    np.maximum.accumulate(last_entry, out=last_entry)
+    exits = np.arange(len(entries)) - last_entry == hold
+    return entries, exits
+
+
+def combined_signals(candles, window=20, std_dev=2, periods=14, oversold=30, overbought=70):
+    """Сигналы combined_market_analysis: покупка — ниже нижней полосы и RSI < oversold, продажа — наоборот"""
+    close = candles["close"]
+    upper, _, lower = kernels.bollinger(close, window, std_dev)
+    rsi = kernels.rsi(close, periods)
+    with np.errstate(invalid="ignore"):
+        entries = (close < lower) & (rsi < oversold)
+        exits = (close > upper) & (rsi > overbought)
+    return entries, exits
+
+
+def auto_sell_signals(candles, take_profit=0.01, confirm=10, min_rise=0.001, drop_threshold=5, period=10,
+                      volume_multiplier=1.5):
+    """
+    Вход на развороте после падения, выход по правилу авто-продажи:
+    цена выросла на take_profit от цены входа, а за следующие confirm свечей
+    максимум не превысил уровень срабатывания больше чем на min_rise.
+    Ценой входа считается закрытие на последнем сигнале входа.
+    """
+    close, high = candles["close"], candles["high"]
+    entries = kernels.crash_reversal(close, candles["volume"], drop_threshold, period, volume_multiplier)
+    index = np.where(entries, np.arange(len(close)), 0)
+    np.maximum.accumulate(index, out=index)
+    entry_price = np.where(index > 0, close[index], np.nan)
+    with np.errstate(invalid="ignore"):
+        reached = close >= entry_price * (1 + take_profit)
+
+    # Максимум high на следующих confirm свечах
+    future_max = np.full(len(close), np.inf)
+    if len(close) > confirm:
+        windows = np.lib.stride_tricks.sliding_window_view(high[1:], confirm)
+        future_max[:len(windows)] = windows.max(axis=1)
+    confirmed = reached & (future_max < close * (1 + min_rise))
+
+    # Продажа происходит в конце окна подтверждения
+    exits = np.zeros(len(close), dtype=bool)
+    exits[confirm:] = confirmed[:-confirm] if confirm else confirmed
+    return entries, exits
+
+
+STRATEGIES = {
+    "crash_reversal": crash_reversal_signals,
+    "combined": combined_signals,
+    "auto_sell": auto_sell_signals,
+}
+
+
+def simulate(candles, entries, exits, fee=0.001, slippage=0.0005):
+    """
+    Исполняет сигналы по цене закрытия свечи с комиссией и проскальзыванием на каждую сделку.
+    :return: dict с PnL, просадкой, числом и долей прибыльных сделок
+    """
+    close = candles["close"]
+    positions = _positions(entries, exits)
+    held = np.concatenate(([0.0], positions[:-1]))  # Позиция, с которой встречаем свечу
+
+    returns = np.zeros(len(close))
+    returns[1:] = close[1:] / close[:-1] - 1
+    turnover = np.abs(np.diff(positions, prepend=0.0))
+    strategy_returns = held * returns - turnover * (fee + slippage)
+
+    equity = np.cumprod(1 + strategy_returns)
+    drawdown = 1 - equity / np.maximum.accumulate(equity) if len(equity) else np.zeros(0)
+
+    # Доход по каждой сделке: сумма лог-доходностей от входа до выхода
+    opened = np.diff(positions, prepend=0.0) > 0
+    trade_id = np.cumsum(opened)
+    in_trade = (held > 0) | (turnover > 0)
+    log_returns = np.log1p(strategy_returns)
+    trade_returns = np.bincount(trade_id[in_trade], weights=log_returns[in_trade],
+                                minlength=int(trade_id[-1]) + 1)[1:] if len(close) else np.zeros(0)
+
+    return {
+        "candles": int(len(close)),
+        "trades": int(opened.sum()),
+        "pnl_pct": float((equity[-1] - 1) * 100) if len(equity) else 0.0,
+        "max_drawdown_pct": float(drawdown.max() * 100) if len(drawdown) else 0.0,
+        "win_rate_pct": float((trade_returns > 0).mean() * 100) if len(trade_returns) else 0.0,
+        "exposure_pct": float(held.mean() * 100) if len(held) else 0.0,
+        "buy_and_hold_pct": float((close[-1] / close[0] - 1) * 100) if len(close) else 0.0,
+    }
+
+
+def run_backtest(candles, strategy="combined", fee=0.001, slippage=0.0005, **params):
+    """Прогоняет стратегию по всей истории одним векторным проходом"""
+    entries, exits = STRATEGIES[strategy](candles, **params)
+    report = simulate(candles, entries, exits, fee, slippage)
+    report["strategy"] = strategy
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэктест сигналов бота на локальных свечах")
+    parser.add_argument("path", help="CSV в формате Binance, .npz со свечами или SYMBOL:interval из хранилища")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="combined")
+    parser.add_argument("--fee", type=float, default=0.001, help="Комиссия за сделку, доля")
+    parser.add_argument("--slippage", type=float, default=0.0005, help="Проскальзывание, доля")
+    args = parser.parse_args()
+
+    candles = load_candles(args.path)
+    report = run_backtest(candles, args.strategy, args.fee, args.slippage)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
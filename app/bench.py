@@ -0,0 +1,291 @@
+"""
+Бенчмарки индикаторов, анализа рынка и обработки тиков.
+
+    python app/bench.py run --out before.json                # индикаторы на 50 ... 10 млн свечей + тики
+    python app/bench.py run --sizes 50,1000 --out quick.json
+    python app/bench.py ticks --rate 2000 --count 20000      # тики с заданной частотой
+    python app/bench.py ticks --file ticks.jsonl             # повтор записанных тиков
+    python app/bench.py record --out ticks.jsonl --duration 300
+    python app/bench.py compare before.json after.json       # сравнение двух прогонов
+
+Результаты — JSON: для каждого замера name, size, runs, min_s, median_s
+(для тиков ещё p99_s, max_s и достигнутая частота).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_SIZES = [50, 1_000, 100_000, 1_000_000, 10_000_000]
+FRAME_MAX_ROWS = 100_000  # Сырые свечи списками Python на миллионы строк не влезают в память
+MIN_TIME = 0.2   # Замер повторяется, пока суммарно не наберётся столько секунд...
+MAX_TIME = 5.0   # ...но не дольше этого
+MAX_RUNS = 100
+
+
+def synthetic_candles(size, seed=0):
+    """Случайное блуждание цены с объёмами: DataFrame с колонками close и volume"""
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.002, size)))
+    volume = rng.lognormal(3, 1, size)
+    return pd.DataFrame({"close": close, "volume": volume})
+
+
+def synthetic_klines(size, seed=0):
+    """Сырые свечи в формате REST Binance (числа строками, как отдаёт биржа)"""
+    df = synthetic_candles(size, seed)
+    rows = []
+    for i, (close, volume) in enumerate(zip(df["close"], df["volume"])):
+        open_time = 1_700_000_000_000 + i * 60_000
+        price = f"{close:.2f}"
+        rows.append([open_time, price, price, price, price, f"{volume:.5f}", open_time + 59_999,
+                     "0", 100, "0", "0", "0"])
+    return rows
+
+
+def synthetic_ticks(count, seed=0, price=30000.0):
+    """Сообщения потока @ticker со случайным блужданием цены"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    prices = price * np.exp(np.cumsum(rng.normal(0, 0.0002, count)))
+    return [{"e": "24hrTicker", "s": "BTCUSDT", "c": f"{p:.2f}"} for p in prices]
+
+
+def measure(func):
+    """Время одного вызова: повторяет func, пока не наберётся MIN_TIME (не меньше 3 раз) или MAX_TIME"""
+    times = []
+    total = 0.0
+    while len(times) < MAX_RUNS:
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        times.append(elapsed)
+        total += elapsed
+        if total >= MAX_TIME or (total >= MIN_TIME and len(times) >= 3):
+            break
+    return {"runs": len(times), "min_s": min(times), "median_s": statistics.median(times)}
+
+
+def bench_indicators(sizes):
+    import numpy as np
+    import indicators
+    import kernels
+    from candles import parse_klines, candle_dtype
+    from trading import klines_to_frame
+
+    results = []
+    for size in sizes:
+        df = synthetic_candles(size)
+        close = df["close"].to_numpy()
+        volume = df["volume"].to_numpy()
+        candles = np.empty(size, dtype=candle_dtype(("close", "volume")))
+        candles["close"], candles["volume"] = close, volume
+        cases = {
+            "bollinger_bands": lambda: indicators.bollinger_bands(df),
+            "calculate_rsi": lambda: indicators.calculate_rsi(df),
+            "combined_market_analysis": lambda: indicators.combined_market_analysis(df),
+            "detect_crash_reversal": lambda: indicators.detect_crash_reversal(df),
+            "calculate_rsi[array]": lambda: indicators.calculate_rsi(candles),
+            "combined_market_analysis[array]": lambda: indicators.combined_market_analysis(candles),
+            "detect_crash_reversal[array]": lambda: indicators.detect_crash_reversal(candles),
+            "kernels.bollinger": lambda: kernels.bollinger(close),
+            "kernels.rsi": lambda: kernels.rsi(close),
+            "kernels.crash_reversal": lambda: kernels.crash_reversal(close, volume),
+        }
+        if size <= FRAME_MAX_ROWS:
+            klines = synthetic_klines(size)
+            cases["klines_to_frame"] = lambda: klines_to_frame(klines)
+            cases["parse_klines"] = lambda: parse_klines(klines)
+            cases["parse_klines[close,volume]"] = lambda: parse_klines(klines, ("close", "volume"))
+
+        for name, func in cases.items():
+            with contextlib.redirect_stdout(io.StringIO()):  # combined_market_analysis печатает сигналы
+                result = measure(func)
+            results.append(dict(name=name, size=size, **result))
+            print(f"{name:<34} {size:>10}  {result['median_s'] * 1000:10.3f} мс  ({result['runs']} прогонов)",
+                  file=sys.stderr)
+    return results
+
+
+async def replay_ticks(ticks, rate=0, triggers=1000):
+    """
+    Прогоняет тики через trading.handle_ws_message, как их доставил бы поток.
+    rate — тиков в секунду (0 — без пауз). Для нагрузки на книгу триггеров вокруг
+    начальной цены ставятся triggers тейк-профитов и стопов в пределах ±5%.
+    """
+    import random
+    import trading
+    from triggers import trigger_book, TAKE_PROFIT, STOP
+
+    start_price = float(ticks[0]["c"])
+    rng = random.Random(0)
+    added = []
+    for i in range(triggers):
+        if i % 2:
+            added.append(trigger_book.add("BTCUSDT", TAKE_PROFIT, start_price * (1 + rng.uniform(0, 0.05))))
+        else:
+            added.append(trigger_book.add("BTCUSDT", STOP, start_price * (1 - rng.uniform(0, 0.05))))
+    trading.monitoring = True  # Как после start_ws_monitoring, но без подписки на поток
+
+    loop = asyncio.get_running_loop()
+    latencies = []
+    started = loop.time()
+    with contextlib.redirect_stdout(io.StringIO()):  # Решения по триггерам печатаются
+        for i, msg in enumerate(ticks):
+            if rate:
+                delay = started + i / rate - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif i % 1000 == 0:
+                await asyncio.sleep(0)  # Даём сработать таймерам окон подтверждения
+            tick_started = time.perf_counter()
+            trading.handle_ws_message(msg)
+            latencies.append(time.perf_counter() - tick_started)
+    elapsed = loop.time() - started
+
+    for trigger in added:
+        trigger_book.cancel(trigger.id)
+    trading.stop_ws_monitoring()
+
+    latencies.sort()
+    return {
+        "name": "handle_ws_message",
+        "size": len(ticks),
+        "runs": len(ticks),
+        "min_s": latencies[0],
+        "median_s": latencies[len(latencies) // 2],
+        "p99_s": latencies[int(len(latencies) * 0.99)],
+        "max_s": latencies[-1],
+        "rate": rate,
+        "achieved_rate": len(ticks) / elapsed if elapsed else None,
+        "triggers": triggers,
+    }
+
+
+def load_ticks(path):
+    """Тики из файла JSON Lines (формат record: {"recv": ..., "msg": {...}} или само сообщение)"""
+    with open(path) as f:
+        return [line.get("msg", line) for line in map(json.loads, f)]
+
+
+def record_ticks(path, symbol="btcusdt", duration=60):
+    """Записывает поток @ticker в JSON Lines с временем получения"""
+    from streams import stream_manager
+    with open(path, "w") as f:
+        def on_tick(msg):
+            f.write(json.dumps({"recv": time.time(), "msg": msg}) + "\n")
+
+        stream_manager.start()
+        subscription = stream_manager.subscribe(f"{symbol}@ticker", callback=on_tick)
+        time.sleep(duration)
+        stream_manager.unsubscribe(subscription)
+        stream_manager.stop()
+
+
+def environment():
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(old_path, new_path, threshold=0.1):
+    """Печатает таблицу old/new по median_s; возвращает число замедлений больше threshold"""
+    with open(old_path) as f:
+        old = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+
+    regressions = 0
+    print(f"{'замер':<34} {'размер':>10} {'было, мс':>12} {'стало, мс':>12} {'x':>7}")
+    for result in new:
+        before = old.get((result["name"], result["size"]))
+        if before is None:
+            continue
+        ratio = result["median_s"] / before["median_s"] if before["median_s"] else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  ⚠ медленнее"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            mark = "  ✓ быстрее"
+        print(f"{result['name']:<34} {result['size']:>10} {before['median_s'] * 1000:12.3f} "
+              f"{result['median_s'] * 1000:12.3f} {ratio:7.2f}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки индикаторов и обработки тиков")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Индикаторы на синтетических свечах и тики")
+    run.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    run.add_argument("--ticks", type=int, default=100_000, help="Сколько тиков прогнать (0 — не гонять)")
+    run.add_argument("--out", help="Файл для результатов JSON (по умолчанию stdout)")
+
+    ticks = commands.add_parser("ticks", help="Повтор тиков через handle_ws_message")
+    ticks.add_argument("--file", help="Записанные тики (bench.py record); без файла — синтетические")
+    ticks.add_argument("--count", type=int, default=100_000)
+    ticks.add_argument("--rate", type=float, default=0, help="Тиков в секунду, 0 — без пауз")
+    ticks.add_argument("--triggers", type=int, default=1000)
+    ticks.add_argument("--out")
+
+    record = commands.add_parser("record", help="Записать поток тикера в файл")
+    record.add_argument("--out", required=True)
+    record.add_argument("--symbol", default="btcusdt")
+    record.add_argument("--duration", type=float, default=60, help="Секунд записи")
+
+    cmp = commands.add_parser("compare", help="Сравнить два файла результатов")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.1, help="Допустимое отклонение, доля")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_ticks(args.out, args.symbol, args.duration)
+        return
+    if args.command == "compare":
+        sys.exit(1 if compare(args.old, args.new, args.threshold) else 0)
+
+    results = []
+    if args.command == "run":
+        results += bench_indicators([int(size) for size in args.sizes.split(",")])
+        if args.ticks:
+            results.append(asyncio.run(replay_ticks(synthetic_ticks(args.ticks))))
+    else:
+        tick_messages = load_ticks(args.file) if args.file else synthetic_ticks(args.count)
+        results.append(asyncio.run(replay_ticks(tick_messages, args.rate, args.triggers)))
+
+    report = json.dumps({"environment": environment(), "results": results}, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Замер скорости старта: время импорта bot и flask_app и время до готовности бота
+(начала polling) в свежем интерпретаторе. Сеть, MySQL и Telegram не нужны:
+polling подменяется, фоновый старт потоков и БД не дожидается.
+
+    python app/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_PROBE = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+READY_PROBE = """
+import time
+start = time.perf_counter()
+import asyncio, os
+import bot
+imported = time.perf_counter()
+
+async def polling(*args, **kwargs):
+    print(imported - start, time.perf_counter() - start, flush=True)
+    os._exit(0)
+
+bot.bot.polling = polling
+asyncio.run(bot.main())
+"""
+
+
+def _run(code, cwd, extra_args=()):
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    env.setdefault("TELEGRAM_TOKEN", "123456:bench")
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *extra_args, "-c", code], cwd=cwd, env=env, capture_output=True,
+                            text=True, timeout=120)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "probe failed")
+    return result.stdout.split(), result.stderr, wall
+
+
+def slowest_imports(module, cwd, top=10):
+    """Модули с наибольшим собственным временем импорта (по python -X importtime), мс"""
+    _, stderr, _ = _run(IMPORT_PROBE.format(module=module), cwd, ("-X", "importtime"))
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us) / 1000, int(cumulative_us) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время старта бота и Flask")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Сколько самых медленных импортов показать")
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        os.makedirs(os.path.join(cwd, "logs"))  # logger пишет в logs/bot.log относительно cwd
+        samples = {"bot_import": [], "bot_ready": [], "bot_process": [], "flask_import": []}
+        for _ in range(args.runs):
+            (imported, ready), _, wall = _run(READY_PROBE, cwd)
+            samples["bot_import"].append(float(imported))
+            samples["bot_ready"].append(float(ready))
+            samples["bot_process"].append(wall)
+            (flask_import,), _, _ = _run(IMPORT_PROBE.format(module="flask_app"), cwd)
+            samples["flask_import"].append(float(flask_import))
+        slowest = slowest_imports("bot", cwd, args.top)
+
+    report = {name: {"median_ms": statistics.median(values) * 1000, "max_ms": max(values) * 1000}
+              for name, values in samples.items()}
+    if args.json:
+        report["slowest_imports"] = [{"module": name, "self_ms": own, "cumulative_ms": cumulative}
+                                     for own, cumulative, name in slowest]
+        print(json.dumps(report, indent=2))
+        return
+
+    names = {"bot_import": "Импорт bot", "bot_ready": "Бот готов (polling)",
+             "bot_process": "Процесс целиком", "flask_import": "Импорт flask_app"}
+    for name, stats in report.items():
+        print(f"{names[name]:<22} медиана {stats['median_ms']:7.1f} мс, максимум {stats['max_ms']:7.1f} мс")
+    print("\nСамые медленные импорты bot (собственное / общее время, мс):")
+    for own, cumulative, name in slowest:
+        print(f"  {own:7.1f} {cumulative:7.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,35 @@
 import asyncio
+import atexit
 import re
+import signal
+import sys
 import io
-import matplotlib.pyplot as plt
-from database import log_to_db
+import time
+from database import init_db_async, log_writer
 from decimal import Decimal, ROUND_DOWN
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import ReplyKeyboardMarkup, KeyboardButton
-from trading import get_price, place_order, get_open_orders, check_market, fetch_historical_data, get_balance, \
-    make_order, fetch_candlestick_data, start_ws_monitoring, stop_ws_monitoring, monitoring
-from indicators import calculate_rsi, detect_crash_reversal, combined_market_analysis
-from config import TELEGRAM_TOKEN, SYMBOL
+from trading import get_price, get_open_orders, check_market, fetch_candles, get_balance, submit_order, \
+    start_ws_monitoring, ensure_ws_monitoring, cancel_sell_triggers
+from triggers import trigger_book, TAKE_PROFIT, STOP, TRAILING
+from indicators import calculate_rsi
+from stream_indicators import get_engine
+from streams import stream_manager
+from price_board import price_board
+from aggregator import start_aggregators
+from order_book import start_order_books
+from notifications import dispatcher, ALERT
+from control import control_server
+from metrics import metrics, watch_loop_lag
+from snapshot import snapshotter
+from config import TELEGRAM_TOKEN, SYMBOL, KLINE_STORE_RECORD, MONITOR_DROP_THRESHOLD
 from logger import logger
-import pandas as pd
-from binance.client import Client
-from config import API_KEY, API_SECRET, CHAT_ID
+from config import CHAT_ID
 from keyboardMenu import get_main_keyboard, get_buy_menu, get_sell_menu
 
 bot = AsyncTeleBot(TELEGRAM_TOKEN)
-client = Client(API_KEY, API_SECRET)
-# monitoring = True
+dispatcher.bind(bot)
+monitoring = False  # Флаг мониторинга рынка
 
 
 def is_authorized(user_id):
@@ -41,6 +52,39 @@ def stop_monitoring():
     monitoring = False
 
 
+def get_status():
+    """Снимок состояния для канала управления (Flask читает его из файла статуса)"""
+    quote = price_board.quote(SYMBOL)
+    return {
+        "monitoring": monitoring,
+        "symbol": SYMBOL,
+        "price": price_board.price(SYMBOL),
+        "bid": quote.bid if quote else None,
+        "ask": quote.ask if quote else None,
+        "triggers": len(trigger_book.list()),
+        "notifications": {"sent": dispatcher.sent, "suppressed": dispatcher.suppressed,
+                          "dropped": dispatcher.dropped},
+    }
+
+
+# Значения, которые уже ведут сами модули, читаются при выгрузке метрик
+metrics.gauge("bot_monitoring", "Включён ли мониторинг рынка", lambda: int(monitoring))
+metrics.gauge("triggers_active", "Активные триггеры авто-продажи", lambda: len(trigger_book.list()))
+metrics.counter("telegram_sent_total", "Отправлено сообщений в Telegram", func=lambda: dispatcher.sent)
+metrics.counter("telegram_suppressed_total", "Подавлено повторов алертов", func=lambda: dispatcher.suppressed)
+metrics.counter("telegram_dropped_total", "Отброшено сообщений при переполнении очереди",
+                func=lambda: dispatcher.dropped)
+metrics.counter("db_log_written_total", "Записано строк лога в MySQL", func=lambda: log_writer.written)
+metrics.counter("db_log_dropped_total", "Отброшено строк лога при переполнении очереди",
+                func=lambda: log_writer.dropped)
+metrics.gauge("price_age_seconds", "Возраст цены в табло", lambda: price_age(SYMBOL))
+
+
+def price_age(symbol):
+    quote = price_board.quote(symbol)
+    return time.monotonic() - quote.price_ts if quote and quote.price_ts else None
+
+
 @bot.message_handler(commands=["start", "menu"])
 async def send_menu(message):
     """
@@ -52,8 +96,8 @@ async def send_menu(message):
 
 @bot.message_handler(func=lambda message: message.text == "📊 Анализ рынка")
 async def market_analysis(message):
-    data = fetch_historical_data("BTCUSDT", interval="15m", limit=50)
-    analysis = combined_market_analysis(data)
+    engine = await get_engine("BTCUSDT", "15m")
+    analysis = engine.analysis()
     await bot.send_message(message.chat.id, f"📊 Анализ рынка:\n\n{analysis}")
 
 
@@ -62,7 +106,7 @@ async def send_price(message):
     """
     Показывает текущий курс BTC.
     """
-    price = get_price()
+    price = await get_price()
     await bot.send_message(message.chat.id, f"Текущий курс BTC: {price} USDT", reply_markup=get_main_keyboard())
 
 
@@ -87,8 +131,7 @@ async def buy_now_menu(message):
         await bot.send_message(message.chat.id, "⛔ У вас нет прав на выполнение этой команды.")
         return
 
-    usdt_balance = get_balance("USDT")
-    price = get_price()
+    usdt_balance, price = await asyncio.gather(get_balance("USDT"), get_price())
     if usdt_balance < 10:  # Проверка, есть ли деньги
         await bot.send_message(message.chat.id, "Недостаточно средств для покупки! 🔴", reply_markup=get_main_keyboard())
         return
@@ -127,7 +170,7 @@ async def process_custom_price(message):
     """
     try:
         price = float(message.text)
-        usdt_balance = get_balance("USDT")
+        usdt_balance = await get_balance("USDT")
         await bot.send_message(message.chat.id, f"Текущий баланс: {usdt_balance} USDT")
         if usdt_balance < 10:
             await bot.send_message(message.chat.id, "Недостаточно средств для покупки! 🔴",
@@ -164,8 +207,9 @@ async def buy_selected_amount(message):
             btc = float(match.group(1))
             usdt = float(match.group(2))
             price = float(match.group(3))
-            order = make_order("BUY", btc, price)
-            await bot.send_message(message.chat.id, f"✅ Ордер на {btc} BTC размещен!\n{order}",
+            # Результат размещения роутер пришлёт в этот чат отдельным сообщением
+            await submit_order("BUY", btc, price, chat_id=message.chat.id)
+            await bot.send_message(message.chat.id, f"📨 Ордер на покупку {btc} BTC по {price} отправлен",
                                    reply_markup=get_main_keyboard())
         else:
             print("Не удалось распарсить строку")
@@ -198,17 +242,19 @@ async def sell_now_menu(message):
         await bot.send_message(message.chat.id, "⛔ У вас нет прав на выполнение этой команды.")
         return
 
-    btc_balance = get_balance("BTC")
+    btc_balance = await get_balance("BTC")
     if btc_balance < 0.0001:  # Проверка, есть ли BTC для продажи
         await bot.send_message(message.chat.id, "Недостаточно BTC для продажи! 🔴", reply_markup=get_main_keyboard())
         return
 
-    price = get_price()
-    await bot.send_message(message.chat.id, f"Текущий курс BTC: {price} USDT", reply_markup=get_main_keyboard())
-
     quantity = Decimal(btc_balance).quantize(Decimal("0.00001"), rounding=ROUND_DOWN)
-    order = place_order("SELL", quantity)
-    await bot.send_message(message.chat.id, f"✅ Ордер на продажу {quantity} BTC размещен!\n{order}",
+    try:
+        # Без цены ордер встаёт по книге заявок: уровень, где продажа всего объёма исполнится целиком
+        intent = await submit_order("SELL", quantity, chat_id=message.chat.id)
+    except ValueError as e:
+        await bot.send_message(message.chat.id, f"Ошибка при создании ордера: {e}", reply_markup=get_main_keyboard())
+        return
+    await bot.send_message(message.chat.id, f"📨 Ордер на продажу {quantity} BTC по {intent.price} USDT отправлен",
                            reply_markup=get_main_keyboard())
 
 
@@ -236,7 +282,7 @@ async def process_custom_sell_price(message):
     """
     try:
         price = float(message.text)
-        btc_balance = get_balance("BTC")
+        btc_balance = await get_balance("BTC")
         await bot.send_message(message.chat.id, f"Текущий баланс: {btc_balance} BTC")
         if btc_balance < 0.0001:
             await bot.send_message(message.chat.id, "Недостаточно BTC для продажи! 🔴", reply_markup=get_main_keyboard())
@@ -272,10 +318,10 @@ async def sell_selected_amount(message):
             btc = float(match.group(1))  # Количество BTC
             usdt = float(match.group(2))  # Эквивалент в USDT
             price = float(match.group(3))  # Цена продажи
-            order = make_order("SELL", btc, price)
+            await submit_order("SELL", btc, price, chat_id=message.chat.id)
         else:
             return None, None, None
-        await bot.send_message(message.chat.id, f"✅ Ордер на продажу {btc} BTC размещен!\n{order}",
+        await bot.send_message(message.chat.id, f"📨 Ордер на продажу {btc} BTC по {price} отправлен",
                                reply_markup=get_main_keyboard())
     except Exception as e:
         await bot.send_message(message.chat.id, f"Ошибка при создании ордера: {e}", reply_markup=get_main_keyboard())
@@ -290,7 +336,7 @@ async def open_orders(message):
         await bot.send_message(message.chat.id, "⛔ У вас нет прав на выполнение этой команды.")
         return
 
-    orders = get_open_orders()
+    orders = await get_open_orders()
     if orders:
         text = "\n".join([f"ID: {o['orderId']}, Сторона: {o['side']}, Цена: {o['price']}" for o in orders])
     else:
@@ -315,26 +361,11 @@ async def send_chart(message):
     Генерируем и отправляем 15-минутный график BTC/USDT.
     """
     try:
-        times, prices = fetch_candlestick_data()
-
-        # Рисуем график
-        plt.figure(figsize=(10, 5))
-        plt.plot(times, prices, label="BTC/USDT", color="blue")
-        plt.xlabel("Время")
-        plt.ylabel("Цена (USDT)")
-        plt.title("15-минутный график BTC/USDT")
-        plt.grid(True)
-        plt.legend()
-
-        # Сохраняем картинку в память
-        img_io = io.BytesIO()
-        plt.savefig(img_io, format="png")
-        img_io.seek(0)
-        plt.close()
-
-        price = get_price()
-
-        await bot.send_photo(message.chat.id, img_io,
+        from charts import render_chart, BOLLINGER, RSI  # ОТЛОЖЕННЫЙ ИМПОРТ: numpy и пул процессов
+        # Рисуется в отдельном процессе и кэшируется до закрытия свечи
+        png, price = await asyncio.gather(render_chart("BTCUSDT", "15m", overlays=(BOLLINGER, RSI)), get_price())
+
+        await bot.send_photo(message.chat.id, io.BytesIO(png),
                              caption=f"📊 15-минутный график BTC/USDT. Текущий курс BTC: {price} USDT")
 
     except Exception as e:
@@ -344,12 +375,8 @@ async def send_chart(message):
 async def fetch_and_calculate_rsi():
     """ Получаем исторические данные и считаем RSI """
     try:
-        klines = client.get_klines(symbol=SYMBOL, interval=Client.KLINE_INTERVAL_15MINUTE, limit=30)
-        df = pd.DataFrame(klines, columns=["timestamp", "open", "high", "low", "close", "volume", "close_time",
-                                           "quote_asset_volume", "number_of_trades", "taker_buy_base",
-                                           "taker_buy_quote", "ignore"])
-        df["close"] = df["close"].astype(float)
-        rsi = calculate_rsi(df)
+        candles = await fetch_candles(SYMBOL, interval="15m", limit=30, columns=("close",))
+        rsi = calculate_rsi(candles)
         return rsi
     except Exception as e:
         logger.error(f"Ошибка получения RSI: {e}")
@@ -362,9 +389,15 @@ async def rsi_alert_loop():
         rsi = await fetch_and_calculate_rsi()
         if rsi is not None:
             if rsi < 30:
-                await bot.send_message(CHAT_ID, f"🔴 RSI = {rsi:.2f} (перепродан!) 🚨")
+                dispatcher.notify(f"🔴 RSI = {rsi:.2f} (перепродан!) 🚨", priority=ALERT,
+                                  alert=("rsi_oversold", SYMBOL))
             elif rsi > 70:
-                await bot.send_message(CHAT_ID, f"🟢 RSI = {rsi:.2f} (перекуплен!) 🚨")
+                dispatcher.notify(f"🟢 RSI = {rsi:.2f} (перекуплен!) 🚨", priority=ALERT,
+                                  alert=("rsi_overbought", SYMBOL))
+            else:
+                # RSI вернулся в норму — следующий выход за границы сообщаем сразу
+                dispatcher.reset(("rsi_oversold", SYMBOL))
+                dispatcher.reset(("rsi_overbought", SYMBOL))
         await asyncio.sleep(60)  # Проверяем раз в час
 
 
@@ -374,14 +407,50 @@ async def market_watcher():
     """
     while True:
         try:
-            message = check_market()
+            message = await check_market()
             if message:
-                await bot.send_message(CHAT_ID, f"⚠ Внимание! {message}")
+                dispatcher.notify(f"⚠ Внимание! {message}", priority=ALERT, alert=("crash_reversal_15m", SYMBOL))
         except Exception as e:
             print(f"Ошибка в market_watcher: {e}")
         await asyncio.sleep(60)  # Ждём 15 минут (900 секунд)
 
 
+def format_scan(table, top=10):
+    """Короткий текст по первым строкам таблицы сканера"""
+    lines = []
+    for row in table.head(top).itertuples():
+        flags = ("📉↗ " if row.crash_reversal else "") + ("📈 " if row.buy_signal else "")
+        lines.append(f"{flags}{row.symbol}: {row.close:g}, RSI {row.rsi:.1f}, %B {row.percent_b:.2f}")
+    return "\n".join(lines)
+
+
+@bot.message_handler(commands=["scan"])
+async def scan_command(message):
+    """
+    Сканирует все пары к USDT и показывает лучшие кандидаты на покупку.
+    """
+    from scanner import scan_market  # ОТЛОЖЕННЫЙ ИМПОРТ: pandas
+    table = await scan_market()
+    await bot.send_message(message.chat.id, f"🔎 Скан рынка ({len(table)} пар):\n\n{format_scan(table)}")
+
+
+async def market_scan_loop():
+    """
+    Раз в минуту сканируем весь рынок и сообщаем о разворотах после падения.
+    """
+    from scanner import scan_market
+    while True:
+        try:
+            table = await scan_market()
+            signals = table[table["crash_reversal"] | table["buy_signal"]]
+            if not signals.empty:
+                dispatcher.notify(f"🔎 Сигналы сканера:\n\n{format_scan(signals)}", priority=ALERT,
+                                  alert=("scan", ",".join(signals["symbol"].head(10))))
+        except Exception as e:
+            logger.error(f"Ошибка в market_scan_loop: {e}")
+        await asyncio.sleep(60)
+
+
 # async def monitor_market():
 #     while True:
 #         data = fetch_historical_data("BTCUSDT", interval="1m", limit=50)
@@ -402,11 +471,12 @@ async def toggle_monitoring(message):
 
 async def monitor_market():
     while monitoring:
-        price = get_price()
+        price = await get_price()
         # log_to_db("INFO", f"Текущая цена BTC: {price}")
-        data = fetch_historical_data("BTCUSDT", interval="1m", limit=50)
-        if detect_crash_reversal(data, 1):
-            await bot.send_message(CHAT_ID, "📉 Обнаружен резкий разворот! Возможен рост!")
+        engine = await get_engine("BTCUSDT", "1m")
+        if engine.crash_reversal(MONITOR_DROP_THRESHOLD):
+            dispatcher.notify("📉 Обнаружен резкий разворот! Возможен рост!", priority=ALERT,
+                              alert=("crash_reversal_1m", SYMBOL))
         await asyncio.sleep(60)
 
 @bot.message_handler(func=lambda message: message.text == '🚀 Авто продажа')
@@ -415,32 +485,47 @@ async def sell_auto_bot(message):
         await bot.send_message(message.chat.id, "⛔ У вас нет прав на выполнение этой команды.")
         return
 
-    await bot.send_message(message.chat.id, "Введите цену, по которой хотите продать BTC:")
+    await bot.send_message(message.chat.id, "Введите цену, по которой хотите продать BTC.\n"
+                                            "Стоп-лосс: «стоп 60000», трейлинг-стоп с откатом в %: «трейлинг 1.5»")
 
     @bot.message_handler(content_types=["text"])
     async def process_sell_step(msg):
         try:
-            price = float(msg.text.strip())
-            start_ws_monitoring(price)
-            await bot.send_message(msg.chat.id, f"🎯 Ожидаем достижения цены {price} USDT...")
-        except ValueError:
+            parts = msg.text.strip().lower().split()
+            if len(parts) == 2 and parts[0] in ("стоп", "stop"):
+                trigger = start_ws_monitoring(float(parts[1]), msg.chat.id, STOP)
+            elif len(parts) == 2 and parts[0] in ("трейлинг", "trail"):
+                trail = float(parts[1]) / 100
+                if not 0 < trail < 1:
+                    await bot.send_message(msg.chat.id, "❌ Откат трейлинга — от 0 до 100%, например «трейлинг 1.5».")
+                    return
+                trigger = start_ws_monitoring(await get_price(), msg.chat.id, TRAILING, trail)
+            else:
+                trigger = start_ws_monitoring(float(parts[0]), msg.chat.id, TAKE_PROFIT)
+            await bot.send_message(msg.chat.id, f"🎯 Добавлен триггер {trigger.describe()}")
+        except (ValueError, IndexError, TypeError):
             await bot.send_message(msg.chat.id, "❌ Некорректное значение! Введите число.")
 
 
 @bot.message_handler(commands=["sell_status"])
 async def check_sell_status(message):
-    """Проверяет статус авто-продажи"""
-    if monitoring:
-        await bot.send_message(message.chat.id, f"✅ Авто-продажа активна! Ждём цену: {target_price} USDT")
+    """Показывает активные триггеры авто-продажи"""
+    triggers = trigger_book.list(message.chat.id)
+    if triggers:
+        text = "\n".join(t.describe() for t in triggers)
+        await bot.send_message(message.chat.id, f"✅ Авто-продажа активна!\n{text}")
     else:
         await bot.send_message(message.chat.id, "⛔ Авто-продажа отключена.")
 
 @bot.message_handler(commands=["sell_cancel"])
 async def cancel_auto_sell(message):
-    """Отменяет авто-продажу"""
-    if monitoring:
-        stop_ws_monitoring()
-        await bot.send_message(message.chat.id, "🚫 Авто-продажа отменена!")
+    """Отменяет авто-продажу: /sell_cancel — все триггеры, /sell_cancel 12 — один"""
+    args = message.text.split()[1:] if message.text.startswith("/") else []
+    trigger_id = int(args[0].lstrip("#")) if args and args[0].lstrip("#").isdigit() else None
+    cancelled = cancel_sell_triggers(message.chat.id, trigger_id)
+    if cancelled:
+        text = "\n".join(t.describe() for t in cancelled)
+        await bot.send_message(message.chat.id, f"🚫 Авто-продажа отменена!\n{text}")
     else:
         await bot.send_message(message.chat.id, "⛔ Авто-продажа и так отключена.")
 
@@ -454,13 +539,55 @@ async def cancel_auto_sell_button(message):
     await cancel_auto_sell(message)
 
 
+async def start_background():
+    """Всё, что не нужно для ответа на первую команду: потоки биржи и схема БД"""
+    # Схема БД — отдельной задачей и первой: сбой потоков не должен оставить запись логов без базы
+    db_task = asyncio.create_task(init_db_async())
+    try:
+        from kline_store import kline_store, KlineRecorder  # ОТЛОЖЕННЫЙ ИМПОРТ: numpy
+        # Одно WebSocket-соединение на процесс, подписки добавляются по мере надобности
+        await asyncio.get_running_loop().run_in_executor(None, stream_manager.start)
+        price_board.start(stream_manager)  # Цены из потока: get_price без запросов к бирже
+        ensure_ws_monitoring()  # Триггеры авто-продажи из снимка снова следят за тикером
+        # Старшие таймфреймы собираются из минутных свечей — кэш свечей не ходит в REST
+        start_aggregators(stream_manager)
+        start_order_books(stream_manager)  # Цена ордеров «сейчас» — по книге заявок, без запроса тикера
+        # Закрытые свечи дописываются в локальное хранилище для бэктестов
+        for symbol, interval in KLINE_STORE_RECORD:
+            KlineRecorder(kline_store, symbol, interval).start(stream_manager)
+    except Exception as e:
+        logger.error(f"Не удалось запустить потоки биржи: {e}")
+    await db_task
+
+
+def snapshot_flags():
+    """Флаги бота, которые переживают перезапуск вместе со снимком состояния"""
+    return {"monitoring": monitoring}
+
+
 async def main():
+    global monitoring
     logger.info("Бот запущен")
+    # Свечи, индикаторы и триггеры из снимка: после рестарта докачивается только разрыв
+    flags = await snapshotter.warm_start(snapshot_flags)
+    monitoring = flags.get("monitoring", False)
+    atexit.register(snapshotter.save)
+    await control_server.start({"start_monitoring": start_monitoring, "stop_monitoring": stop_monitoring,
+                                "status": get_status}, get_status)
+    # Бот отвечает сразу, пока в фоне поднимаются WebSocket и MySQL;
+    # до готовности цены берутся по REST, а логи копятся в очереди
+    asyncio.create_task(start_background())
+    asyncio.create_task(watch_loop_lag())
+    asyncio.create_task(metrics.publish_loop())  # Flask отдаёт выгрузку на /metrics
+    asyncio.create_task(snapshotter.run())
     # asyncio.create_task(rsi_alert_loop())  # Запускаем мониторинг RSI
     # asyncio.create_task(market_watcher())  # Запускаем фоновый процесс анализа рынка
+    # asyncio.create_task(market_scan_loop())  # Сканируем все пары к USDT раз в минуту
     asyncio.create_task(monitor_market())
     await bot.polling()
 
 
 if __name__ == "__main__":
+    # docker stop шлёт SIGTERM: завершаемся штатно, чтобы отработали atexit (логи, снимок состояния)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     asyncio.run(main())
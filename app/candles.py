@@ -0,0 +1,46 @@
+import operator
+import numpy as np
+
+# Поля свечи: имя, тип и номер поля в свече Binance (формат REST get_klines)
+COLUMNS = (
+    ("open_time", np.int64, 0),
+    ("open", np.float64, 1),
+    ("high", np.float64, 2),
+    ("low", np.float64, 3),
+    ("close", np.float64, 4),
+    ("volume", np.float64, 5),
+    ("close_time", np.int64, 6),
+    ("quote_volume", np.float64, 7),
+    ("trades", np.int64, 8),
+    ("taker_buy_base", np.float64, 9),
+    ("taker_buy_quote", np.float64, 10),
+)
+_INDEX = {name: (dtype, i) for name, dtype, i in COLUMNS}
+
+# Одна свеча — 88 байт вместо дюжины объектов Python в DataFrame со строками
+KLINE_DTYPE = np.dtype([(name, dtype) for name, dtype, _ in COLUMNS])
+
+
+def candle_dtype(columns=None):
+    """Структурированный тип с нужными колонками (по умолчанию — KLINE_DTYPE)"""
+    if columns is None:
+        return KLINE_DTYPE
+    return np.dtype([(name, _INDEX[name][0]) for name in columns])
+
+
+def parse_klines(klines, columns=None):
+    """
+    Сырые свечи Binance (списки со строками чисел) -> структурированный массив NumPy.
+    Один проход: np.fromiter сразу разбирает строки в числа нужного типа,
+    без промежуточных списков и object-колонок.
+    :param columns: какие колонки разбирать (например, ("close", "volume")), по умолчанию все
+    :return: массив с полями candle_dtype(columns); колонка — candles["close"]
+    """
+    dtype = candle_dtype(columns)
+    indices = [_INDEX[name][1] for name in dtype.names]
+    if len(indices) == 1:
+        index = indices[0]
+        rows = ((row[index],) for row in klines)
+    else:
+        rows = map(operator.itemgetter(*indices), klines)
+    return np.fromiter(rows, dtype=dtype, count=len(klines))
@@ -0,0 +1,119 @@
+import asyncio
+import concurrent.futures
+import io
+from collections import OrderedDict
+import numpy as np
+import kernels
+from config import CHART_WORKERS, CHART_CACHE_SIZE
+from kline_cache import kline_cache, INTERVAL_MS
+
+BOLLINGER = "bollinger"
+RSI = "rsi"
+
+_executor = None
+_cache = OrderedDict()  # (symbol, interval, close_time последней свечи, limit, overlays) -> PNG
+_inflight = {}          # тот же ключ -> asyncio.Future, пока график рисуется
+
+
+def _render_png(title, times, opens, highs, lows, closes, bar_width, overlays):
+    """
+    Рисует свечной график в PNG. Выполняется в отдельном процессе:
+    только объектный API Figure и бэкенд Agg, без глобального состояния pyplot.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    with_rsi = RSI in overlays
+    fig = Figure(figsize=(10, 7 if with_rsi else 5))
+    FigureCanvasAgg(fig)
+    if with_rsi:
+        ax, ax_rsi = fig.subplots(2, 1, sharex=True, gridspec_kw={"height_ratios": [3, 1]})
+    else:
+        ax = fig.subplots()
+
+    up = closes >= opens
+    colors = np.where(up, "tab:green", "tab:red")
+    ax.vlines(times, lows, highs, colors=colors, linewidth=1)
+    ax.bar(times, np.where(up, closes - opens, opens - closes), bar_width, bottom=np.minimum(opens, closes),
+           color=colors)
+
+    if BOLLINGER in overlays:
+        upper, middle, lower = kernels.bollinger(closes)
+        ax.plot(times, middle, color="tab:blue", linewidth=1, label="SMA 20")
+        ax.plot(times, upper, color="tab:gray", linewidth=1, linestyle="--", label="Боллинджер")
+        ax.plot(times, lower, color="tab:gray", linewidth=1, linestyle="--")
+        ax.legend()
+
+    if with_rsi:
+        ax_rsi.plot(times, kernels.rsi(closes), color="tab:purple", linewidth=1)
+        ax_rsi.axhline(70, color="tab:red", linewidth=0.8, linestyle=":")
+        ax_rsi.axhline(30, color="tab:green", linewidth=0.8, linestyle=":")
+        ax_rsi.set_ylim(0, 100)
+        ax_rsi.set_ylabel("RSI")
+        ax_rsi.grid(True)
+        ax_rsi.set_xlabel("Время")
+    else:
+        ax.set_xlabel("Время")
+
+    ax.set_ylabel("Цена (USDT)")
+    ax.set_title(title)
+    ax.grid(True)
+    fig.autofmt_xdate()
+
+    img_io = io.BytesIO()
+    fig.savefig(img_io, format="png")
+    return img_io.getvalue()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ProcessPoolExecutor(max_workers=CHART_WORKERS)
+    return _executor
+
+
+async def render_chart(symbol="BTCUSDT", interval="15m", limit=50, overlays=(BOLLINGER,)):
+    """
+    PNG свечного графика с наложениями (BOLLINGER, RSI).
+    Один и тот же график в пределах одной свечи рисуется один раз:
+    готовые картинки кэшируются, одновременные запросы ждут общий результат.
+    """
+    klines = await kline_cache.get(symbol, interval, limit)
+    overlays = tuple(sorted(overlays))
+    key = (symbol, interval, klines[-1][6], limit, overlays)
+
+    png = _cache.get(key)
+    if png is not None:
+        _cache.move_to_end(key)
+        return png
+    if key in _inflight:
+        # shield: отмена одного ждущего не должна отменять общий результат
+        return await asyncio.shield(_inflight[key])
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        rows = np.array([k[:5] for k in klines], dtype=np.float64)
+        times = rows[:, 0].astype(np.int64).astype("datetime64[ms]")
+        bar_width = INTERVAL_MS.get(interval, 60_000) / 86_400_000 * 0.8  # В днях, как ось дат matplotlib
+        title = f"{symbol} {interval}"
+        png = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), _render_png, title, times, rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4],
+            bar_width, overlays)
+        _cache[key] = png
+        while len(_cache) > CHART_CACHE_SIZE:
+            _cache.popitem(last=False)
+        future.set_result(png)
+        return png
+    except asyncio.CancelledError:
+        future.cancel()  # Ждущие получат отмену, а не зависнут
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Помечаем ошибку полученной, если ждущих запросов не было
+        raise
+    finally:
+        if _inflight.get(key) is future:
+            del _inflight[key]
@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import time
+from config import COALESCE_TTL
+
+# Все обёрнутые функции: имя -> обёртка (для invalidate и статистики)
+endpoints = {}
+
+
+def coalesce(name, ttl=None):
+    """
+    Декоратор для асинхронных функций чтения.
+    Одновременные вызовы с одинаковыми аргументами ждут один общий запрос,
+    а результат переиспользуется ttl секунд (по умолчанию — COALESCE_TTL[name]).
+    Ошибка не кэшируется, но достаётся всем, кто ждал этот запрос. Поэтому обёрнутая
+    функция должна бросать исключение, а не возвращать заглушку (None, 0, []):
+    заглушка закэшируется на ttl. Заглушки подставляют вызывающие.
+    Результат общий для всех вызывающих — менять его нельзя.
+    """
+    ttl = COALESCE_TTL.get(name, 1.0) if ttl is None else ttl
+
+    def decorator(func):
+        cache = {}     # ключ аргументов -> (истекает, результат)
+        inflight = {}  # ключ аргументов -> asyncio.Future
+        generation = 0  # Растёт при invalidate: результаты запросов, начатых раньше, не кэшируются
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            cached = cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                wrapper.hits += 1
+                return cached[1]
+            if key in inflight:
+                wrapper.coalesced += 1
+                return await asyncio.shield(inflight[key])
+
+            wrapper.misses += 1
+            started = generation
+            future = asyncio.get_running_loop().create_future()
+            inflight[key] = future
+            try:
+                result = await func(*args, **kwargs)
+                if started == generation:
+                    cache[key] = (time.monotonic() + ttl, result)
+                future.set_result(result)
+                return result
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()  # Помечаем ошибку полученной, если ждущих не было
+                raise
+            finally:
+                if inflight.get(key) is future:
+                    del inflight[key]
+
+        def invalidate():
+            """Сбрасывает кэш; следующие вызовы не присоединяются к уже идущим запросам"""
+            nonlocal generation
+            generation += 1
+            cache.clear()
+            inflight.clear()
+
+        def stats():
+            return {"hits": wrapper.hits, "coalesced": wrapper.coalesced, "misses": wrapper.misses,
+                    "cached": len(cache), "ttl": ttl}
+
+        wrapper.hits = wrapper.coalesced = wrapper.misses = 0
+        wrapper.invalidate = invalidate
+        wrapper.stats = stats
+        endpoints[name] = wrapper
+        return wrapper
+
+    return decorator
+
+
+def invalidate(*names):
+    """Сбрасывает кэш перечисленных функций"""
+    for name in names:
+        endpoints[name].invalidate()
+
+
+def stats():
+    """Счётчики попаданий и промахов по всем функциям"""
+    return {name: wrapper.stats() for name, wrapper in endpoints.items()}
@@ -10,4 +10,93 @@ CHAT_ID = os.getenv("CHAT_ID")  # Чат, откуда разрешены ком
 
 # Настройки бота
 SYMBOL = "BTCUSDT"  # Торговая пара
-AMOUNT = 0.001      # Количество для ордера
\ No newline at end of file
+AMOUNT = 0.001      # Количество для ордера
+
+# Сколько REST-запросов к Binance может выполняться одновременно
+EXCHANGE_WORKERS = 8
+
+# Кэш свечей
+KLINE_CACHE_SIZE = 1000       # Свечей в буфере на пару (symbol, interval)
+KLINE_CACHE_PAIRS = 64        # Сколько пар держать в памяти
+KLINE_REFRESH_SECONDS = 5     # Как часто обновлять незакрытую свечу
+
+# Сканер рынка
+SCAN_QUOTE = "USDT"           # Сканируем все пары к этой валюте
+SCAN_INTERVAL = "15m"
+SCAN_LIMIT = 50               # Свечей на инструмент
+
+# WebSocket
+STREAM_QUEUE_SIZE = 1000      # Размер очереди сообщений на подписчика
+STREAM_BATCH_DELAY = 0.2      # Сколько ждать других изменений подписок, прежде чем переоткрыть соединение, сек
+STREAM_CHECK_INTERVAL = 5.0   # Как часто проверять, жив ли менеджер WebSocket, сек
+STREAM_MAX_BACKOFF = 60       # Наибольшая пауза перед повторным открытием соединения, сек
+
+# MySQL
+DB_POOL_SIZE = 4              # Соединений в пуле
+DB_LOG_QUEUE_SIZE = 10000     # Записей лога в очереди на запись
+DB_LOG_BATCH_SIZE = 200       # Записей в одном INSERT
+DB_LOG_FLUSH_MS = 500         # Не дольше этого ждём добора пачки
+DB_LOG_DROP_OLDEST = False    # При переполнении: True — выкинуть самую старую запись, False — новую
+DB_INIT_MAX_DELAY = 30        # Наибольшая пауза между попытками создать схему при старте, сек
+
+# API логов
+LOGS_PAGE_SIZE = 50           # Записей на страницу по умолчанию
+LOGS_MAX_PAGE_SIZE = 500
+LOGS_CACHE_TTL = 2            # Секунд держим готовый ответ /logs
+
+# Графики
+CHART_WORKERS = 2             # Процессов для отрисовки
+CHART_CACHE_SIZE = 32         # Готовых картинок в памяти
+
+# Локальное хранилище свечей
+KLINE_STORE_DIR = os.getenv("KLINE_STORE_DIR", "data/klines")
+KLINE_STORE_RECORD = [("BTCUSDT", "1m")]  # Какие свечи дописывать из WebSocket
+
+# Роутер ордеров
+ORDER_WORKERS = 4             # Сколько ордеров отправляется одновременно
+ORDER_MAX_RETRIES = 5         # Повторов при таймаутах, 5xx и 429/418
+ORDER_BUDGET_SHARE = 0.9      # Какую долю лимитов биржи может занять бот
+
+# Кэш запросов чтения: сколько секунд переиспользовать ответ
+COALESCE_TTL = {
+    "price": 1.0,
+    "balance": 5.0,
+    "open_orders": 2.0,
+}
+
+# Табло цен из WebSocket
+PRICE_SYMBOLS = [SYMBOL]      # Для каких пар держать цену в памяти
+PRICE_MAX_AGE = 2.0           # Старше этого (сек) цена из потока не используется, идём в REST
+
+# Уведомления в Telegram
+NOTIFY_GLOBAL_RATE = 25       # Сообщений в секунду всего (лимит Telegram — 30)
+NOTIFY_CHAT_INTERVAL = 1.0    # Не чаще одного сообщения в секунду в чат
+NOTIFY_COOLDOWN = 900         # Один и тот же алерт по инструменту не чаще раза в 15 минут
+NOTIFY_DIGEST_WINDOW = 2.0    # Сколько секунд копить сообщения в один дайджест
+NOTIFY_QUEUE_SIZE = 1000      # Сообщений в очереди, дальше неважные отбрасываются
+
+# Канал управления ботом (общий том ./run для бота и Flask)
+CONTROL_SOCKET = os.getenv("CONTROL_SOCKET", "run/control.sock")
+STATUS_FILE = os.getenv("STATUS_FILE", "run/status.json")
+STATUS_INTERVAL = 1.0         # Как часто бот обновляет файл статуса, сек
+
+# Метрики (Prometheus на /metrics во Flask)
+METRICS_FILE = os.getenv("METRICS_FILE", "run/metrics.prom")
+METRICS_INTERVAL = 5.0        # Как часто бот выгружает метрики в файл, сек
+LOOP_LAG_INTERVAL = 0.5       # Период замера задержки event loop, сек
+
+# Старшие таймфреймы из минутного потока свечей
+AGGREGATE_SYMBOLS = [SYMBOL]
+AGGREGATE_INTERVALS = ["5m", "15m", "1h", "4h", "1d"]  # Только кратные минуте и укладывающиеся в сутки
+
+# Пороги сигналов (подбираются на истории: python app/sweep.py BTCUSDT:1m --strategy crash_reversal)
+MONITOR_DROP_THRESHOLD = 1    # Падение, %, после которого monitor_market ищет разворот на минутках
+
+# Локальная книга заявок (снимок REST + поток изменений)
+ORDER_BOOK_SYMBOLS = [SYMBOL]
+ORDER_BOOK_DEPTH = 1000       # Уровней в снимке (вес запроса 50 при 1000)
+ORDER_BOOK_MAX_AGE = 5.0      # Книга без обновлений дольше этого (сек) не используется для цены ордера
+
+# Снимок состояния для быстрого перезапуска (том ./data переживает пересоздание контейнера)
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE", "data/snapshot.bin")
+SNAPSHOT_INTERVAL = 30.0      # Как часто сохранять снимок, сек
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from config import CONTROL_SOCKET, STATUS_FILE, STATUS_INTERVAL
+from logger import logger
+
+# Протокол: клиент шлёт одну строку JSON {"cmd": ..., "args": {...}},
+# сервер отвечает одной строкой JSON {"ok": true, "result": ...} или {"ok": false, "error": ...}
+
+
+class ControlServer:
+    """
+    Канал управления ботом для других процессов (Flask) на одной машине/томе:
+    - Unix-сокет CONTROL_SOCKET принимает команды;
+    - файл STATUS_FILE раз в STATUS_INTERVAL секунд и после каждой команды
+      перезаписывается снимком состояния, чтобы статус читался без обращения к боту.
+    """
+
+    def __init__(self, path=CONTROL_SOCKET, status_file=STATUS_FILE, interval=STATUS_INTERVAL):
+        self.path = path
+        self.status_file = status_file
+        self.interval = interval
+        self.commands = {}
+        self.status = dict
+        self._server = None
+        self._task = None
+
+    async def start(self, commands, status):
+        """
+        :param commands: имя команды -> функция (обычная или async) от аргументов команды
+        :param status: функция, возвращающая dict состояния
+        """
+        self.commands = commands
+        self.status = status
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Сокет от прошлого запуска
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        self._task = asyncio.create_task(self._publish_loop())
+        logger.info(f"Канал управления: {self.path}")
+
+    async def _handle(self, reader, writer):
+        try:
+            line = await reader.readline()
+            request = json.loads(line)
+            handler = self.commands[request["cmd"]]
+            result = handler(**request.get("args", {}))
+            if asyncio.iscoroutine(result):
+                result = await result
+            response = {"ok": True, "result": result}
+            self.publish()
+        except Exception as e:
+            response = {"ok": False, "error": repr(e)}
+        writer.write(json.dumps(response, default=str).encode() + b"\n")
+        await writer.drain()
+        writer.close()
+
+    def publish(self):
+        """Атомарно перезаписывает файл статуса"""
+        snapshot = dict(self.status(), updated=time.time())
+        tmp = f"{self.status_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f, default=str)
+        os.replace(tmp, self.status_file)
+
+    async def _publish_loop(self):
+        while True:
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Не удалось записать статус: {e}")
+            await asyncio.sleep(self.interval)
+
+
+control_server = ControlServer()
+
+
+# Клиентская часть — без зависимостей от бота, Telegram и Binance
+
+_status_cache = (None, None)  # (mtime_ns и размер файла, разобранный статус)
+
+
+def read_status(path=STATUS_FILE, max_age=None):
+    """
+    Последний снимок состояния бота. Файл перечитывается, только если изменился,
+    так что обычно это один stat(). Если файла нет или он старше max_age — None.
+    """
+    global _status_cache
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    version = (stat.st_mtime_ns, stat.st_size)
+    if _status_cache[0] != version:
+        with open(path) as f:
+            _status_cache = (version, json.load(f))
+    status = _status_cache[1]
+    if max_age is not None and time.time() - status.get("updated", 0) > max_age:
+        return None
+    return status
+
+
+def send_command(cmd, path=CONTROL_SOCKET, timeout=2.0, **args):
+    """Отправляет команду боту и возвращает result; при ошибке бота — RuntimeError"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({"cmd": cmd, "args": args}).encode() + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    try:
+        response = json.loads(data)
+    except ValueError:
+        raise RuntimeError("бот закрыл соединение без ответа" if not data else "некорректный ответ бота")
+    if not isinstance(response, dict) or "ok" not in response:
+        raise RuntimeError("некорректный ответ бота")
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response["result"]
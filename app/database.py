@@ -1,6 +1,13 @@
-import mysql.connector
+import asyncio
+import atexit
 import os
+import queue
+import threading
 import time
+from datetime import datetime
+from config import DB_POOL_SIZE, DB_LOG_QUEUE_SIZE, DB_LOG_BATCH_SIZE, DB_LOG_FLUSH_MS, DB_LOG_DROP_OLDEST, \
+    DB_INIT_MAX_DELAY
+from metrics import db_write_latency, db_errors
 
 DB_CONFIG = {
     "host": "mysql",
@@ -9,45 +16,174 @@ DB_CONFIG = {
     "database": os.getenv("MYSQL_DATABASE", "bot"),
 }
 
+_pool = None
+_pool_lock = threading.Lock()
+db_ready = threading.Event()  # Схема создана, логи можно писать
 
-def get_db_connection():
-    """Пытаемся подключиться к MySQL с повторными попытками"""
-    retries = 10  # Увеличиваем количество попыток
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from mysql.connector import pooling  # ОТЛОЖЕННЫЙ ИМПОРТ
+            _pool = pooling.MySQLConnectionPool(pool_name="bot", pool_size=DB_POOL_SIZE, **DB_CONFIG)
+        return _pool
+
+
+def get_db_connection(retries=10):
+    """Пытаемся получить соединение из пула MySQL с повторными попытками"""
+    import mysql.connector
     for i in range(retries):
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            return conn
+            # close() у такого соединения возвращает его в пул
+            return _get_pool().get_connection()
         except mysql.connector.Error as e:
             print(f"⚠️ MySQ не доступен, попытка {i+1}/{retries}... Ждём 5 сек")
-            time.sleep(5)
+            if i + 1 < retries:
+                time.sleep(5)
     raise Exception("❌ Не удалось подключиться к MySQL! Проверь настройки.")
 
+
+class LogWriter:
+    """
+    Фоновая запись логов в MySQL.
+    Записи копятся в ограниченной очереди и пишутся одним многострочным INSERT
+    каждые batch_size записей или flush_ms миллисекунд — что наступит раньше.
+    При переполнении очереди запись отбрасывается (новая или самая старая),
+    вызывающий код никогда не ждёт базу.
+    """
+
+    def __init__(self, batch_size=DB_LOG_BATCH_SIZE, flush_ms=DB_LOG_FLUSH_MS, maxsize=DB_LOG_QUEUE_SIZE,
+                 drop_oldest=DB_LOG_DROP_OLDEST):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, level, message):
+        self._ensure_started()
+        record = (level, message, datetime.now())
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.drop_oldest:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.put_nowait(record)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="db-log-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        db_ready.wait()  # Пока схемы нет, записи копятся в очереди
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                # executemany для INSERT собирает один многострочный запрос
+                cursor.executemany("INSERT INTO logs (level, message, timestamp) VALUES (%s, %s, %s)", batch)
+                conn.commit()
+                cursor.close()
+            finally:
+                conn.close()
+            self.written += len(batch)
+            db_write_latency.observe(time.perf_counter() - started)
+        except Exception as e:
+            db_errors.inc()
+            print(f"Ошибка логирования ({len(batch)} записей потеряно): {e}")
+
+    def flush(self):
+        """Синхронно записывает всё, что осталось в очереди (при завершении процесса)"""
+        if not db_ready.is_set():
+            return  # База так и не поднялась — не держим завершение процесса ожиданием MySQL
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) == self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.flush)
+
+
 def log_to_db(level, message):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO logs (level, message) VALUES (%s, %s)", (level, message))
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception as e:
-        print(f"Ошибка логирования: {e}")
-
-def init_db():
-    """Создаёт таблицу логов, если её нет"""
-    conn = get_db_connection()
+    """Ставит запись лога в очередь фоновой записи; не блокирует вызывающего"""
+    log_writer.put(level, message)
+
+def init_db(retries=10):
+    """Создаёт таблицу логов, если её нет, и нужные индексы"""
+    conn = get_db_connection(retries)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS logs (
             id INT AUTO_INCREMENT PRIMARY KEY,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             level VARCHAR(10),
-            message TEXT
+            message TEXT,
+            INDEX idx_logs_timestamp (timestamp),
+            INDEX idx_logs_level_id (level, id)
         );
     """)
+    # Таблицы, созданные до появления индексов, догоняем отдельно
+    for name, columns in (("idx_logs_timestamp", "timestamp"), ("idx_logs_level_id", "level, id")):
+        cursor.execute("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'logs' AND index_name = %s
+            LIMIT 1
+        """, (name,))
+        if not cursor.fetchall():
+            cursor.execute(f"CREATE INDEX {name} ON logs ({columns})")
     conn.commit()
     cursor.close()
     conn.close()
+    db_ready.set()
 
-# Инициализируем БД при запуске
-init_db()
\ No newline at end of file
+
+async def init_db_async(max_delay=DB_INIT_MAX_DELAY):
+    """
+    Инициализирует БД в фоне, не задерживая старт бота:
+    при недоступном MySQL повторяет с растущей паузой (1, 2, 4 ... max_delay сек).
+    """
+    delay = 1
+    while True:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, init_db, 1)
+            print("✅ MySQL готов")
+            return
+        except Exception as e:
+            print(f"⚠️ MySQL не готов ({e}), повтор через {delay} сек")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
@@ -0,0 +1,101 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from config import API_KEY, API_SECRET, SYMBOL, EXCHANGE_WORKERS
+from metrics import exchange_latency, exchange_errors
+
+# Единственный клиент Binance на процесс: REST-вызовы уходят в пул потоков,
+# а HTTP-соединения переиспользуются через общий пул requests.Session.
+# Клиент создаётся при первом запросе: импорт python-binance и ping биржи не задерживают старт.
+_client = None
+_client_lock = threading.Lock()
+response_hooks = []  # Хуки requests, которые вешаются на сессию клиента при создании
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=EXCHANGE_WORKERS, thread_name_prefix="binance")
+
+
+def get_client():
+    """Общий клиент Binance (создаётся при первом обращении)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from binance.client import Client  # ОТЛОЖЕННЫЙ ИМПОРТ
+                from requests.adapters import HTTPAdapter
+                client = Client(API_KEY, API_SECRET)
+                client.session.mount("https://", HTTPAdapter(pool_connections=EXCHANGE_WORKERS,
+                                                             pool_maxsize=EXCHANGE_WORKERS))
+                client.session.hooks["response"].extend(response_hooks)
+                _client = client
+    return _client
+
+
+def __getattr__(name):
+    # exchange.client по-прежнему работает, но создаёт клиента только при обращении
+    if name == "client":
+        return get_client()
+    raise AttributeError(name)
+
+
+def _invoke(method, params):
+    return getattr(get_client(), method)(**params)
+
+
+async def _call(method, **params):
+    """Выполняет синхронный вызов клиента в пуле потоков, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, _invoke, method, params)
+    except Exception:
+        exchange_errors.inc(method)
+        raise
+    finally:
+        exchange_latency.observe(time.perf_counter() - started, method)
+
+
+async def get_price(symbol=SYMBOL) -> float:
+    """Текущая цена по тикеру"""
+    ticker = await _call("get_symbol_ticker", symbol=symbol)
+    return float(ticker["price"])
+
+
+async def get_klines(symbol=SYMBOL, interval="1h", limit=100, **params):
+    """Свечи в сыром формате Binance"""
+    return await _call("get_klines", symbol=symbol, interval=interval, limit=limit, **params)
+
+
+async def get_order_book(symbol=SYMBOL, limit=1000):
+    """Снимок книги заявок: {'lastUpdateId', 'bids': [[цена, объём], ...], 'asks': [...]}"""
+    return await _call("get_order_book", symbol=symbol, limit=limit)
+
+
+async def get_balance(asset):
+    """Баланс актива в формате Binance ({'asset', 'free', 'locked'}) или None"""
+    return await _call("get_asset_balance", asset=asset)
+
+
+async def get_open_orders(symbol=SYMBOL):
+    """Открытые ордера по паре"""
+    return await _call("get_open_orders", symbol=symbol)
+
+
+async def create_order(**params):
+    """Создаёт ордер"""
+    return await _call("create_order", **params)
+
+
+async def get_order(**params):
+    """Ордер по orderId или origClientOrderId"""
+    return await _call("get_order", **params)
+
+
+async def create_test_order(**params):
+    """Создаёт тестовый ордер (без исполнения)"""
+    return await _call("create_test_order", **params)
+
+
+async def get_exchange_info():
+    """Правила торговли и список инструментов биржи"""
+    return await _call("get_exchange_info")
@@ -1,33 +1,137 @@
-from flask import Flask, render_template, jsonify, request
-import os
+from flask import Flask, render_template, jsonify, request, Response
+import hashlib
+import time
 from database import get_db_connection  # Подключаем MySQL
-from bot import start_monitoring, stop_monitoring, is_monitoring
+from control import read_status, send_command  # Бот работает в другом процессе: только сокет и файл статуса
+from metrics import read_metrics
+from config import LOGS_PAGE_SIZE, LOGS_MAX_PAGE_SIZE, LOGS_CACHE_TTL, STATUS_INTERVAL, METRICS_INTERVAL
 
 app = Flask(__name__)
 
+LOG_FIELDS = ("id", "timestamp", "level", "message")
+LOGS_CACHE_SIZE = 256
+
+# Готовые ответы /logs: ключ запроса -> (истекает, тело, etag, следующий before_id)
+logs_cache = {}
+
+
+def is_monitoring():
+    status = read_status(max_age=STATUS_INTERVAL * 5)
+    return bool(status and status["monitoring"])
+
+
 @app.route("/")
 def index():
     return render_template("index.html", monitoring=is_monitoring())
 
-@app.route("/logs")
-def get_logs():
+
+@app.route("/status")
+def status():
+    """Последний снимок состояния бота; 503, если бот давно его не обновлял"""
+    snapshot = read_status(max_age=STATUS_INTERVAL * 5)
+    if snapshot is None:
+        return jsonify({"error": "бот недоступен"}), 503
+    return jsonify(snapshot)
+
+
+@app.route("/metrics")
+def get_metrics():
+    """Метрики бота в формате Prometheus: готовая выгрузка из файла, бот при этом не опрашивается"""
+    body = read_metrics(max_age=METRICS_INTERVAL * 5)
+    if body is None:
+        return Response("# бот недоступен\n", status=503, mimetype="text/plain")
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
+def parse_logs_query(args):
+    """
+    Разбирает параметры /logs:
+    limit, before_id (keyset-пагинация по id), level, since/until (диапазон времени),
+    fields (список колонок через запятую).
+    """
+    limit = min(max(args.get("limit", LOGS_PAGE_SIZE, type=int), 1), LOGS_MAX_PAGE_SIZE)
+    fields = tuple(f for f in args.get("fields", ",".join(LOG_FIELDS)).split(",") if f in LOG_FIELDS)
+    return (
+        fields or LOG_FIELDS,
+        limit,
+        args.get("before_id", type=int),
+        args.get("level"),
+        args.get("since"),
+        args.get("until"),
+    )
+
+
+def query_logs(fields, limit, before_id, level, since, until):
+    """Страница логов от новых к старым; порядок по id позволяет обойтись индексом без сортировки"""
+    conditions, params = [], []
+    if before_id is not None:
+        conditions.append("id < %s")
+        params.append(before_id)
+    if level:
+        conditions.append("level = %s")
+        params.append(level)
+    if since:
+        conditions.append("timestamp >= %s")
+        params.append(since)
+    if until:
+        conditions.append("timestamp < %s")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    columns = ", ".join(("id",) + tuple(f for f in fields if f != "id"))
+
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM logs ORDER BY timestamp DESC LIMIT 50")
+    cursor.execute(f"SELECT {columns} FROM logs {where} ORDER BY id DESC LIMIT %s", (*params, limit))
     logs = cursor.fetchall()
     cursor.close()
     conn.close()
-    return jsonify(logs)
+
+    next_before_id = logs[-1]["id"] if len(logs) == limit else None
+    if "id" not in fields:
+        for log in logs:
+            del log["id"]
+    return logs, next_before_id
+
+
+@app.route("/logs")
+def get_logs():
+    key = parse_logs_query(request.args)
+    now = time.monotonic()
+    cached = logs_cache.get(key)
+    if cached is None or cached[0] < now:
+        logs, next_before_id = query_logs(*key)
+        body = app.json.dumps(logs)
+        etag = hashlib.sha1(body.encode()).hexdigest()
+        if len(logs_cache) >= LOGS_CACHE_SIZE:
+            logs_cache.clear()
+        cached = logs_cache[key] = (now + LOGS_CACHE_TTL, body, etag, next_before_id)
+    _, body, etag, next_before_id = cached
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.max_age = LOGS_CACHE_TTL
+    if next_before_id is not None:
+        response.headers["X-Next-Before-Id"] = str(next_before_id)
+    return response
+
+def control(cmd, status):
+    try:
+        send_command(cmd)
+    except (OSError, RuntimeError) as e:
+        return jsonify({"status": "error", "error": str(e)}), 503
+    return jsonify({"status": status})
 
 @app.route("/start_monitoring", methods=["POST"])
 def start():
-    start_monitoring()
-    return jsonify({"status": "started"})
+    return control("start_monitoring", "started")
 
 @app.route("/stop_monitoring", methods=["POST"])
 def stop():
-    stop_monitoring()
-    return jsonify({"status": "stopped"})
+    return control("stop_monitoring", "stopped")
 
 if __name__ == "__main__":
+    # Для разработки; в контейнере приложение обслуживает gunicorn (см. docker-compose.yml)
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -1,4 +1,16 @@
-import pandas as pd
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd  # Только для аннотаций: DataFrame приходит от вызывающего
+
+# Все функции принимают DataFrame или массивы свечей без pandas: структурированный
+# массив из candles.parse_klines либо dict колонок (kline_store). Для массивов
+# считается на NumPy (kernels), а там, где нужна только последняя точка, — по хвосту ряда.
+
+
+def _is_frame(data):
+    return hasattr(data, "iloc")
 
 
 def bollinger_bands(data: pd.DataFrame, window=20, std_dev=2):
@@ -9,6 +21,10 @@ def bollinger_bands(data: pd.DataFrame, window=20, std_dev=2):
     :param std_dev: Количество стандартных отклонений.
     :return: (верхняя полоса, средняя полоса, нижняя полоса)
     """
+    if not _is_frame(data):
+        import kernels  # ОТЛОЖЕННЫЙ ИМПОРТ: numpy
+        return kernels.bollinger(data['close'], window, std_dev)
+
     rolling_mean = data['close'].rolling(window=window).mean()
     rolling_std = data['close'].rolling(window=window).std()
 
@@ -22,12 +38,24 @@ def is_price_outside_bollinger(data: pd.DataFrame):
     """
     Проверяет, пробила ли цена верхнюю/нижнюю границу Боллинджера.
     """
+    if not _is_frame(data):
+        # Полосы нужны только на последней свече — хватит последнего окна
+        close = data['close'][-20:]
+        upper_band, _, lower_band = bollinger_bands({'close': close})
+        return bollinger_signal(close[-1], upper_band[-1], lower_band[-1])
+
     upper_band, _, lower_band = bollinger_bands(data)
     latest_close = data['close'].iloc[-1]
+    return bollinger_signal(latest_close, upper_band.iloc[-1], lower_band.iloc[-1])
+
 
-    if latest_close > upper_band.iloc[-1]:
+def bollinger_signal(price, upper, lower):
+    """
+    Текст сигнала по положению цены относительно полос Боллинджера.
+    """
+    if price > upper:
         return "🔴 Цена выше верхней границы (перекупленность)"
-    elif latest_close < lower_band.iloc[-1]:
+    elif price < lower:
         return "🟢 Цена ниже нижней границы (перепроданность)"
     return "⚪ В пределах нормального диапазона"
 
@@ -39,6 +67,11 @@ def calculate_rsi(data: pd.DataFrame, periods: int = 14) -> float:
     :param window: Окно для расчета RSI.
     :return: Последнее значение RSI.
     """
+    if not _is_frame(data):
+        import kernels  # ОТЛОЖЕННЫЙ ИМПОРТ: numpy
+        # Последнему значению нужны только periods последних изменений цены
+        return float(kernels.rsi(data['close'][-(periods + 1):], periods)[-1])
+
     delta = data['close'].diff()
     gain = (delta.where(delta > 0, 0)).rolling(window=periods).mean()
     loss = (-delta.where(delta < 0, 0)).rolling(window=periods).mean()
@@ -53,7 +86,13 @@ def check_rsi_signal(data: pd.DataFrame):
     """
     Анализирует RSI и дает сигнал.
     """
-    rsi = calculate_rsi(data)
+    return rsi_signal(calculate_rsi(data))
+
+
+def rsi_signal(rsi):
+    """
+    Текст сигнала по значению RSI.
+    """
     if rsi > 70:
         return f"🔴 RSI = {round(rsi, 2)} (Перекупленность)"
     elif rsi < 30:
@@ -71,6 +110,13 @@ def combined_market_analysis(data: pd.DataFrame):
     print(bollinger_signal)
     print(rsi_signal)
 
+    return combine_signals(bollinger_signal, rsi_signal)
+
+
+def combine_signals(bollinger_signal, rsi_signal):
+    """
+    Объединяет сигналы Боллинджера и RSI в итоговый вывод.
+    """
     if "Перекупленность" in bollinger_signal and "Перекупленность" in rsi_signal:
         return f"🚨 Сигнал на продажу! {bollinger_signal}, {rsi_signal}"
 
@@ -89,6 +135,15 @@ def detect_crash_reversal(data: pd.DataFrame, drop_threshold=5, period=10, volum
     :param volume_multiplier: Во сколько раз должен увеличиться объем после падения.
     :return: True, если разворот обнаружен.
     """
+    if not _is_frame(data):
+        close, volume = data["close"], data["volume"]
+        price_change = (close[-1] - close[-period:][0]) / close[-period:][0] * 100
+        if price_change < -drop_threshold:
+            volume_before = volume[-(period * 2):-period]
+            avg_volume_before = volume_before.mean() if len(volume_before) else float("nan")
+            return bool(volume[-period:].mean() > avg_volume_before * volume_multiplier)
+        return False
+
     recent_data = data.iloc[-period:]
 
     # Рассчитываем изменение цены
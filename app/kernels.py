@@ -0,0 +1,79 @@
+import numpy as np
+
+# Векторные версии индикаторов на NumPy.
+# Все функции работают по последней оси: подходят и для одного ряда (время),
+# и для матрицы (инструменты × время). Возвращают ряды той же формы,
+# где первые значения без полного окна равны NaN.
+
+
+def _rolling_sum(x, window):
+    """Скользящая сумма по последней оси через накопленную сумму"""
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] < window:
+        return out
+    csum = np.cumsum(x, axis=-1)
+    out[..., window - 1] = csum[..., window - 1]
+    out[..., window:] = csum[..., window:] - csum[..., :-window]
+    return out
+
+
+def rolling_mean(x, window):
+    x = np.asarray(x, dtype=np.float64)
+    # Сдвигаем ряд к первому значению, чтобы накопленная сумма не теряла точность
+    base = x[..., :1]
+    return _rolling_sum(x - base, window) / window + base
+
+
+def rolling_std(x, window):
+    """Скользящее стандартное отклонение с ddof=1, как в pandas"""
+    x = np.asarray(x, dtype=np.float64)
+    shifted = x - x[..., :1]
+    total = _rolling_sum(shifted, window)
+    total_sq = _rolling_sum(shifted * shifted, window)
+    var = (total_sq - total * total / window) / (window - 1)
+    return np.sqrt(np.maximum(var, 0.0))
+
+
+def bollinger(closes, window=20, std_dev=2):
+    """(верхняя, средняя, нижняя) полосы Боллинджера"""
+    mean = rolling_mean(closes, window)
+    std = rolling_std(closes, window)
+    return mean + std * std_dev, mean, mean - std * std_dev
+
+
+def rsi(closes, periods=14):
+    """RSI с простым скользящим средним приростов и потерь, как в calculate_rsi"""
+    closes = np.asarray(closes, dtype=np.float64)
+    delta = np.diff(closes, axis=-1)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    out = np.full(closes.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = _rolling_sum(gain, periods) / _rolling_sum(loss, periods)
+        out[..., 1:] = 100 - 100 / (1 + rs)
+    return out
+
+
+def crash_reversal(closes, volumes, drop_threshold=5, period=10, volume_multiplier=1.5):
+    """
+    Флаги detect_crash_reversal для каждой свечи: падение больше drop_threshold%
+    за period свечей и рост среднего объёма в volume_multiplier раз
+    относительно предыдущих period свечей. Считается только на полных окнах.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+    flags = np.zeros(closes.shape, dtype=bool)
+    if closes.shape[-1] < 2 * period:
+        return flags
+
+    first = closes[..., :-(period - 1)] if period > 1 else closes
+    price_change = np.full(closes.shape, np.nan)
+    price_change[..., period - 1:] = (closes[..., period - 1:] - first) / first * 100
+
+    volume_after = rolling_mean(volumes, period)
+    volume_before = np.full(closes.shape, np.nan)
+    volume_before[..., period:] = volume_after[..., :-period]
+
+    with np.errstate(invalid="ignore"):
+        flags = (price_change < -drop_threshold) & (volume_after > volume_before * volume_multiplier)
+    return flags
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+import exchange
+from config import KLINE_CACHE_SIZE, KLINE_CACHE_PAIRS, KLINE_REFRESH_SECONDS
+from logger import logger
+
+# Длительность свечей Binance в миллисекундах
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 60 * 60_000,
+    "2h": 2 * 60 * 60_000,
+    "4h": 4 * 60 * 60_000,
+    "6h": 6 * 60 * 60_000,
+    "8h": 8 * 60 * 60_000,
+    "12h": 12 * 60 * 60_000,
+    "1d": 24 * 60 * 60_000,
+    "3d": 3 * 24 * 60 * 60_000,
+    "1w": 7 * 24 * 60 * 60_000,
+}
+
+MAX_KLINES_PER_REQUEST = 1000
+
+
+def stream_kline_to_row(k):
+    """Переводит свечу из WebSocket ('k' в событии kline) в формат REST get_klines"""
+    return [k["t"], k["o"], k["h"], k["l"], k["c"], k["v"], k["T"], k["q"], k["n"], k["V"], k["Q"], k["B"]]
+
+
+def _merge(buffer, rows):
+    """Дописывает свечи в буфер, заменяя уже лежащие там свечи с тем же или более поздним open_time"""
+    if not rows:
+        return
+    first_open = rows[0][0]
+    while buffer and buffer[-1][0] >= first_open:
+        buffer.pop()
+    buffer.extend(rows)
+
+
+class KlineCache:
+    """
+    Общий для процесса кэш свечей.
+    На каждую пару (symbol, interval) хранится кольцевой буфер сырых свечей Binance:
+    один раз загружается история, дальше докачиваются только свечи новее последней,
+    а давно не используемые пары вытесняются (LRU).
+    """
+
+    def __init__(self, maxlen=KLINE_CACHE_SIZE, max_pairs=KLINE_CACHE_PAIRS, refresh=KLINE_REFRESH_SECONDS):
+        self.maxlen = maxlen
+        self.max_pairs = max_pairs
+        self.refresh = refresh
+        self._buffers = OrderedDict()  # (symbol, interval) -> deque свечей
+        self._synced = {}  # (symbol, interval) -> time.monotonic() последней синхронизации
+        self._locks = {}
+        self._active = {}  # (symbol, interval) -> число вызовов get, ждущих замок или держащих его
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self._buffers
+
+    async def get(self, symbol, interval, limit=100):
+        """
+        Возвращает последние limit свечей в формате REST get_klines.
+        Запрос к бирже идёт только если буфер пуст, короче limit или устарел.
+        limit больше MAX_KLINES_PER_REQUEST урезается: больше одним запросом не загрузить,
+        и такой буфер считался бы неполным при каждом вызове.
+        """
+        limit = min(limit, MAX_KLINES_PER_REQUEST)
+        key = (symbol, interval)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._active[key] = self._active.get(key, 0) + 1
+        try:
+            async with lock:
+                buffer = self._buffers.get(key)
+                if buffer is None or len(buffer) < limit:
+                    self.misses += 1
+                    buffer = await self._backfill(key, limit)
+                elif self._is_stale(key, buffer):
+                    self.misses += 1
+                    buffer = await self._sync(key, buffer)
+                else:
+                    self.hits += 1
+                self._touch(key)
+                return list(islice(buffer, max(len(buffer) - limit, 0), None))
+        finally:
+            active = self._active[key] - 1
+            if active:
+                self._active[key] = active
+            else:
+                del self._active[key]
+
+    def update(self, symbol, interval, row):
+        """Кладёт свечу из потока (формат REST) в буфер, если пара уже есть в кэше"""
+        key = (symbol, interval)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            return
+        _merge(buffer, [row])
+        self._synced[key] = time.monotonic()
+
+    def export(self):
+        """Буферы всех пар для снимка состояния: {(symbol, interval): [свечи]}"""
+        return {key: list(buffer) for key, buffer in self._buffers.items()}
+
+    def restore(self, buffers):
+        """
+        Загружает буферы из снимка. Время синхронизации не восстанавливается,
+        поэтому первый get по паре докачает только свечи после снимка.
+        """
+        for key, rows in buffers.items():
+            if rows:
+                self._buffers[key] = deque(rows, maxlen=max(self.maxlen, len(rows)))
+                self._synced[key] = 0.0
+                self._touch(key)
+
+    def _is_stale(self, key, buffer):
+        now_ms = time.time() * 1000
+        last_close_time = buffer[-1][6]
+        if now_ms > last_close_time:
+            return True  # Последняя свеча закрылась, пора докачать новую
+        return time.monotonic() - self._synced.get(key, 0) > self.refresh
+
+    async def _backfill(self, key, limit):
+        symbol, interval = key
+        size = max(self.maxlen, limit)
+        klines = await exchange.get_klines(symbol, interval, min(size, MAX_KLINES_PER_REQUEST))
+        buffer = deque(klines, maxlen=size)
+        self._buffers[key] = buffer
+        self._synced[key] = time.monotonic()
+        logger.info(f"Кэш свечей {symbol} {interval}: загружено {len(buffer)} свечей")
+        return buffer
+
+    async def _sync(self, key, buffer):
+        symbol, interval = key
+        last_open_time = buffer[-1][0]
+        interval_ms = INTERVAL_MS.get(interval)
+        if interval_ms and (time.time() * 1000 - last_open_time) / interval_ms >= MAX_KLINES_PER_REQUEST:
+            # Разрыв слишком большой для одной страницы — проще загрузить заново
+            return await self._backfill(key, len(buffer))
+        klines = await exchange.get_klines(symbol, interval, MAX_KLINES_PER_REQUEST, startTime=last_open_time)
+        _merge(buffer, klines)
+        self._synced[key] = time.monotonic()
+        return buffer
+
+    def _touch(self, key):
+        self._buffers.move_to_end(key)
+        excess = len(self._buffers) - self.max_pairs
+        if excess <= 0:
+            return
+        # Пары, которые сейчас синхронизируются или ждут замка, не вытесняем: иначе следующий
+        # вызов создаст новый замок и пойдёт в биржу параллельно с текущим
+        for evicted in [k for k in self._buffers if k not in self._active][:excess]:
+            del self._buffers[evicted]
+            self._synced.pop(evicted, None)
+            self._locks.pop(evicted, None)
+            logger.info(f"Кэш свечей: вытеснена пара {evicted}")
+
+
+kline_cache = KlineCache()
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import contextlib
+import fcntl
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+import exchange
+from config import KLINE_STORE_DIR
+from candles import COLUMNS, parse_klines
+from kline_cache import INTERVAL_MS, MAX_KLINES_PER_REQUEST, stream_kline_to_row
+from logger import logger
+
+
+def rows_to_columns(rows):
+    """Сырые свечи Binance -> dict колонка -> numpy-массив"""
+    candles = parse_klines(rows)
+    return {name: candles[name] for name, _, _ in COLUMNS}
+
+
+class KlineStore:
+    """
+    Локальное хранилище свечей: на каждую пару (symbol, interval) — каталог,
+    в нём по файлу фиксированной ширины на колонку. Файлы только дописываются,
+    читаются через np.memmap без копирования и разбора.
+    """
+
+    def __init__(self, root=KLINE_STORE_DIR):
+        self.root = root
+
+    def path(self, symbol, interval):
+        return os.path.join(self.root, symbol, interval)
+
+    def _file(self, symbol, interval, name):
+        return os.path.join(self.path(symbol, interval), f"{name}.bin")
+
+    def length(self, symbol, interval):
+        """Число свечей (по самой короткой колонке — на случай оборванной записи)"""
+        lengths = []
+        for name, dtype, _ in COLUMNS:
+            file = self._file(symbol, interval, name)
+            size = os.path.getsize(file) if os.path.exists(file) else 0
+            lengths.append(size // np.dtype(dtype).itemsize)
+        return min(lengths)
+
+    @contextlib.contextmanager
+    def _locked(self, symbol, interval):
+        """
+        Эксклюзивная блокировка пары между процессами (бот с KlineRecorder и CLI backfill):
+        проверка длины и дозапись колонок не должны перемежаться.
+        """
+        os.makedirs(self.path(symbol, interval), exist_ok=True)
+        with open(os.path.join(self.path(symbol, interval), ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _repair(self, symbol, interval):
+        """Обрезает колонки до общей длины после оборванной записи"""
+        length = self.length(symbol, interval)
+        for name, dtype, _ in COLUMNS:
+            file = self._file(symbol, interval, name)
+            if os.path.exists(file) and os.path.getsize(file) != length * np.dtype(dtype).itemsize:
+                os.truncate(file, length * np.dtype(dtype).itemsize)
+        return length
+
+    def open(self, symbol, interval, columns=None):
+        """
+        Колонки как np.memmap (только чтение, без копирования).
+        :param columns: список нужных колонок, по умолчанию все
+        """
+        length = self.length(symbol, interval)
+        result = {}
+        for name, dtype, _ in COLUMNS:
+            if columns is not None and name not in columns:
+                continue
+            if length == 0:
+                result[name] = np.empty(0, dtype=dtype)
+            else:
+                result[name] = np.memmap(self._file(symbol, interval, name), dtype=dtype, mode="r", shape=(length,))
+        return result
+
+    def last_open_time(self, symbol, interval):
+        length = self.length(symbol, interval)
+        if length == 0:
+            return None
+        return int(np.memmap(self._file(symbol, interval, "open_time"), dtype=np.int64, mode="r",
+                             offset=(length - 1) * 8, shape=(1,))[0])
+
+    def append(self, symbol, interval, rows):
+        """
+        Дописывает свечи (формат REST) новее последней сохранённой.
+        Возвращает число записанных свечей.
+        """
+        if not rows:
+            return 0
+        with self._locked(symbol, interval):
+            last = self.last_open_time(symbol, interval)
+            if last is not None:
+                rows = [row for row in rows if row[0] > last]
+            if not rows:
+                return 0
+            self._repair(symbol, interval)
+            columns = rows_to_columns(rows)
+            for name, _, _ in COLUMNS:
+                with open(self._file(symbol, interval, name), "ab") as f:
+                    f.write(columns[name].tobytes())
+            return len(rows)
+
+    def gaps(self, symbol, interval):
+        """Пропуски в истории: список (open_time последней свечи до разрыва, open_time первой после)"""
+        open_time = self.open(symbol, interval, ["open_time"])["open_time"]
+        if len(open_time) < 2:
+            return []
+        broken = np.flatnonzero(np.diff(open_time) != INTERVAL_MS[interval])
+        return [(int(open_time[i]), int(open_time[i + 1])) for i in broken]
+
+    def backfill(self, client, symbol, interval, start_ms, end_ms=None, pause=0.1):
+        """
+        Докачивает историю страницами по 1000 свечей через REST.
+        Продолжает с последней сохранённой свечи, поэтому прерванную загрузку
+        можно просто запустить заново. Незакрытая текущая свеча не сохраняется.
+        """
+        interval_ms = INTERVAL_MS[interval]
+        last = self.last_open_time(symbol, interval)
+        start = max(start_ms, last + interval_ms) if last is not None else start_ms
+        end_ms = end_ms or int(time.time() * 1000)
+        total = 0
+        while start < end_ms:
+            rows = client.get_klines(symbol=symbol, interval=interval, startTime=start, endTime=end_ms,
+                                     limit=MAX_KLINES_PER_REQUEST)
+            now_ms = time.time() * 1000
+            rows = [row for row in rows if row[6] < now_ms]
+            if not rows:
+                break
+            total += self.append(symbol, interval, rows)
+            start = rows[-1][0] + interval_ms
+            logger.info(f"Хранилище {symbol} {interval}: +{len(rows)} свечей, до {_format_ms(rows[-1][0])}")
+            time.sleep(pause)  # Не выбираем лимит веса запросов целиком
+        return total
+
+
+def _format_ms(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+class KlineRecorder:
+    """
+    Дописывает в хранилище закрытые свечи из WebSocket-потока kline.
+    Если между последней сохранённой и новой свечой есть разрыв
+    (переподключение, рестарт), недостающие свечи докачиваются через REST.
+    """
+
+    def __init__(self, store, symbol, interval):
+        self.store = store
+        self.symbol = symbol
+        self.interval = interval
+        self.subscription = None
+        self.loop = None
+        self._lock = None
+
+    def start(self, stream_manager):
+        """Подписывается на поток свечей; вызывать из event loop бота"""
+        self.loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        # Колбэк в потоке WebSocket, без схлопывания: закрытую свечу терять нельзя
+        self.subscription = stream_manager.subscribe(f"{self.symbol.lower()}@kline_{self.interval}",
+                                                     callback=self._on_kline)
+
+    def _on_kline(self, msg):
+        # Запись и докачка — в event loop бота, по порядку поступления
+        if msg["k"]["x"]:
+            future = asyncio.run_coroutine_threadsafe(self.append_closed(stream_kline_to_row(msg["k"])), self.loop)
+            future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            # Свеча не записана; разрыв вместе с ней докачается при следующей закрытой свече
+            logger.error(f"Хранилище {self.symbol} {self.interval}: не удалось записать свечу: {future.exception()}")
+
+    async def append_closed(self, row):
+        async with self._lock:  # Пока докачивается разрыв, следующая свеча ждёт
+            last = self.store.last_open_time(self.symbol, self.interval)
+            interval_ms = INTERVAL_MS[self.interval]
+            if last is not None and row[0] > last + interval_ms:
+                # Страницами, как backfill: после долгого простоя разрыв длиннее одного запроса
+                start = last + interval_ms
+                while start < row[0]:
+                    missing = await exchange.get_klines(self.symbol, self.interval, MAX_KLINES_PER_REQUEST,
+                                                        startTime=start, endTime=row[0] - 1)
+                    if not missing:
+                        break
+                    self.store.append(self.symbol, self.interval, missing)
+                    start = missing[-1][0] + interval_ms
+                logger.info(f"Хранилище {self.symbol} {self.interval}: докачан разрыв с {_format_ms(last + interval_ms)}")
+            self.store.append(self.symbol, self.interval, [row])
+
+
+kline_store = KlineStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальное хранилище свечей")
+    parser.add_argument("command", choices=["backfill", "info", "gaps"])
+    parser.add_argument("symbol")
+    parser.add_argument("interval", choices=sorted(INTERVAL_MS))
+    parser.add_argument("--start", default="2017-08-17", help="Начало истории для backfill, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        start = datetime.strptime(args.start, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        added = kline_store.backfill(exchange.client, args.symbol, args.interval, int(start.timestamp() * 1000))
+        print(f"Добавлено свечей: {added}")
+    elif args.command == "info":
+        length = kline_store.length(args.symbol, args.interval)
+        print(f"Свечей: {length}")
+        if length:
+            open_time = kline_store.open(args.symbol, args.interval, ["open_time"])["open_time"]
+            print(f"С {_format_ms(open_time[0])} по {_format_ms(open_time[-1])}")
+    else:
+        for before, after in kline_store.gaps(args.symbol, args.interval):
+            print(f"Разрыв: {_format_ms(before)} -> {_format_ms(after)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from config import METRICS_FILE, METRICS_INTERVAL, LOOP_LAG_INTERVAL
+from logger import logger
+
+# Границы корзин гистограмм задержек, сек: от 0.1 мс до 10 с
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+
+def _labels_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """
+    Монотонный счётчик; значения по наборам меток.
+    С func значение не копится, а читается при выгрузке (счётчики, которые уже ведёт сам модуль).
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=(), func=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.func = func
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        if self.func:
+            return [(self.name, "", self.func())]
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, _labels_text(self.labels, key), value) for key, value in values]
+
+
+class Gauge:
+    """Текущее значение: задаётся set() или вычисляется функцией при выгрузке"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, func=None):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        value = self.func() if self.func else self.value
+        return [(self.name, "", value)] if value is not None else []
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами. observe() — поиск корзины бисекцией
+    и пара сложений под замком, без аллокаций: годится для горячего пути.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # значения меток -> [счётчики по корзинам (+Inf последней), сумма]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        result = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                result.append((f"{self.name}_bucket", _labels_text(self.labels + ("le",), key + (le,)), cumulative))
+            result.append((f"{self.name}_sum", _labels_text(self.labels, key), total))
+            result.append((f"{self.name}_count", _labels_text(self.labels, key), cumulative))
+        return result
+
+
+class Registry:
+    """
+    Метрики процесса бота. Замеры копятся в памяти; раз в interval секунд
+    publish_loop пишет их в файл в текстовом формате Prometheus,
+    а Flask отдаёт этот файл на /metrics. Так стоимость выгрузки не зависит
+    от того, как часто её забирают.
+    """
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._metrics = {}
+
+    def _register(self, metric):
+        # Повторная регистрация (перезагрузка модуля, повторный вызов) возвращает ту же метрику
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=(), func=None):
+        return self._register(Counter(name, help, labels, func))
+
+    def gauge(self, name, help, func=None):
+        return self._register(Gauge(name, help, func))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.error(f"Метрика {metric.name} не посчиталась: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def publish(self):
+        """Атомарно перезаписывает файл метрик"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, self.path)
+
+    async def publish_loop(self):
+        while True:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.publish)
+            except Exception as e:
+                logger.error(f"Не удалось записать метрики: {e}")
+            await asyncio.sleep(self.interval)
+
+
+metrics = Registry()
+
+# Общие метрики: модули импортируют нужные отсюда
+exchange_latency = metrics.histogram("binance_request_seconds", "Время REST-запроса к Binance (с ожиданием пула)",
+                                     ("method",))
+exchange_errors = metrics.counter("binance_errors_total", "Ошибки REST-запросов к Binance", ("method",))
+db_write_latency = metrics.histogram("db_write_seconds", "Время записи пачки логов в MySQL")
+db_errors = metrics.counter("db_errors_total", "Неудачные записи пачек логов в MySQL")
+telegram_latency = metrics.histogram("telegram_send_seconds", "Время отправки сообщения в Telegram")
+telegram_errors = metrics.counter("telegram_errors_total", "Ошибки отправки в Telegram", ("code",))
+tick_handle_latency = metrics.histogram("tick_handle_seconds", "Обработка тика: триггеры и подтверждение тренда")
+tick_to_decision = metrics.histogram("tick_to_decision_seconds",
+                                     "От времени события на бирже до конца обработки тика")
+trend_decision_latency = metrics.histogram("trend_decision_seconds",
+                                           "От срабатывания тейк-профита до решения по тренду",
+                                           buckets=(1, 2, 5, 10, 15, 20, 30, 60))
+order_latency = metrics.histogram("order_seconds", "От постановки ордера в очередь роутера до ответа биржи",
+                                  ("side", "result"))
+stream_reconnects = metrics.counter("stream_reconnects_total", "Переоткрытия WebSocket-соединения после отказа",
+                                    ("reason",))
+order_book_resyncs = metrics.counter("order_book_resyncs_total", "Перезагрузки локальной книги заявок", ("symbol",))
+decisions_total = metrics.counter("decisions_total", "Решения по триггерам", ("action",))
+loop_lag = metrics.histogram("event_loop_lag_seconds", "Опоздание таймера event loop")
+loop_lag_last = metrics.gauge("event_loop_lag_last_seconds", "Последнее замеренное опоздание event loop")
+
+
+async def watch_loop_lag(interval=LOOP_LAG_INTERVAL):
+    """
+    Замеряет, насколько позже срока просыпается sleep(interval):
+    всё, что больше нуля, — время, когда loop был занят чужим синхронным кодом.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - expected, 0.0)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
+        if lag > 1.0:
+            logger.warning(f"Event loop был заблокирован {lag:.2f} с")
+
+
+# Клиентская часть для Flask: только чтение файла
+_file_cache = (None, None)  # (mtime_ns и размер файла, содержимое)
+
+
+def read_metrics(path=METRICS_FILE, max_age=None):
+    """
+    Последняя выгрузка метрик бота. Файл перечитывается, только если изменился.
+    Если файла нет или он старше max_age секунд — None.
+    """
+    global _file_cache
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if max_age is not None and time.time() - stat.st_mtime > max_age:
+        return None
+    version = (stat.st_mtime_ns, stat.st_size)
+    if _file_cache[0] != version:
+        with open(path) as f:
+            _file_cache = (version, f.read())
+    return _file_cache[1]
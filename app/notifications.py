@@ -1,8 +1,160 @@
 import asyncio
-from config import CHAT_ID
+import itertools
+import time
+from config import (CHAT_ID, NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_INTERVAL, NOTIFY_COOLDOWN, NOTIFY_DIGEST_WINDOW,
+                    NOTIFY_QUEUE_SIZE)
+from logger import logger
+from metrics import telegram_latency, telegram_errors
 
+# Приоритеты сообщений: меньше — важнее
+URGENT = 0  # Ордера и авто-продажа: уходят без ожидания дайджеста
+ALERT = 1   # Сигналы рынка
+INFO = 2
 
-async def send_telegram_notification(text):
-    """Отправляет сообщение в Telegram-бот"""
-    from bot import bot  # ОТЛОЖЕННЫЙ ИМПОРТ
-    await bot.send_message(CHAT_ID, text)
+MAX_MESSAGE_LENGTH = 4096  # Ограничение Telegram на длину сообщения
+
+
+class NotificationDispatcher:
+    """
+    Очередь исходящих сообщений в Telegram.
+    notify() только кладёт сообщение в очередь и никогда не ждёт сеть.
+    Отправкой занимается одна фоновая задача:
+    - не чаще global_rate сообщений в секунду всего и одного в chat_interval секунд в чат;
+    - важные сообщения уходят первыми;
+    - всё, что накопилось для чата, уходит одним сообщением-дайджестом;
+    - одинаковые алерты (тип, инструмент) не повторяются чаще cooldown секунд;
+    - при 429 от Telegram отправка ставится на паузу на retry_after.
+    """
+
+    def __init__(self, global_rate=NOTIFY_GLOBAL_RATE, chat_interval=NOTIFY_CHAT_INTERVAL,
+                 cooldown=NOTIFY_COOLDOWN, digest_window=NOTIFY_DIGEST_WINDOW, maxsize=NOTIFY_QUEUE_SIZE):
+        self.global_interval = 1 / global_rate
+        self.chat_interval = chat_interval
+        self.cooldown = cooldown
+        self.digest_window = digest_window
+        self.maxsize = maxsize
+        self.bot = None
+        self.sent = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self._pending = {}     # chat_id -> [(priority, seq, text, первая постановка)]
+        self._size = 0
+        self._chat_next = {}   # chat_id -> time.monotonic(), раньше которого в чат не пишем
+        self._global_next = 0.0
+        self._alerts = {}      # (тип, инструмент) -> время последнего алерта
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+    def bind(self, bot):
+        """Бот, через который уходят сообщения (задаётся в bot.py)"""
+        self.bot = bot
+
+    def notify(self, text, chat_id=CHAT_ID, priority=INFO, alert=None, cooldown=None):
+        """
+        Ставит сообщение в очередь. Вызывать из event loop.
+        :param alert: ключ (тип, инструмент) для подавления повторов
+        :return: False, если сообщение подавлено как повтор или очередь переполнена
+        """
+        now = time.monotonic()
+        if alert is not None:
+            last = self._alerts.get(alert)
+            if last is not None and now - last < (self.cooldown if cooldown is None else cooldown):
+                self.suppressed += 1
+                return False
+        if self._size >= self.maxsize and priority != URGENT:
+            self.dropped += 1
+            return False
+
+        self._pending.setdefault(chat_id, []).append((priority, next(self._seq), text, now))
+        self._size += 1
+        if alert is not None:
+            # Отсчёт паузы — только для алерта, который действительно ушёл в очередь
+            self._alerts[alert] = now
+        self._ensure_started()
+        self._wakeup.set()
+        return True
+
+    def reset(self, alert):
+        """Условие алерта прошло: следующее срабатывание сообщается сразу"""
+        self._alerts.pop(alert, None)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _next_chat(self, now):
+        """Чат, которому пора отправлять, или время, когда это станет возможно"""
+        best, wake_at = None, None
+        for chat_id, items in self._pending.items():
+            ready_at = self._chat_next.get(chat_id, 0.0)
+            top = min(items)
+            if top[0] != URGENT:
+                ready_at = max(ready_at, min(item[3] for item in items) + self.digest_window)
+            ready_at = max(ready_at, self._global_next)
+            if ready_at <= now:
+                if best is None or top < best[0]:
+                    best = (top, chat_id)
+            elif wake_at is None or ready_at < wake_at:
+                wake_at = ready_at
+        return (best[1] if best else None), wake_at
+
+    def _take_digest(self, chat_id):
+        """Забирает из очереди чата столько сообщений, сколько влезает в одно, важные первыми"""
+        items = sorted(self._pending.pop(chat_id))
+        taken, length = [], 0
+        while items and (not taken or length + len(items[0][2]) + 2 <= MAX_MESSAGE_LENGTH):
+            taken.append(items.pop(0))
+            length += len(taken[-1][2]) + 2
+        if items:
+            self._pending[chat_id] = items
+        self._size -= len(taken)
+        return taken
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            chat_id, wake_at = self._next_chat(now)
+            if chat_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wake_at - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._send(chat_id, self._take_digest(chat_id))
+
+    async def _send(self, chat_id, items):
+        now = time.monotonic()
+        self._global_next = now + self.global_interval
+        self._chat_next[chat_id] = now + self.chat_interval
+        try:
+            text = "\n\n".join(item[2] for item in items)
+            await self.bot.send_message(chat_id, text[:MAX_MESSAGE_LENGTH])
+            telegram_latency.observe(time.monotonic() - now)
+            self.sent += 1
+        except Exception as e:
+            telegram_errors.inc(getattr(e, "error_code", None) or type(e).__name__)
+            retry_after = getattr(e, "result_json", None) and e.result_json.get("parameters", {}).get("retry_after")
+            if getattr(e, "error_code", None) == 429 and retry_after:
+                # Telegram просит подождать: возвращаем сообщения в очередь и молчим во все чаты
+                logger.warning(f"Telegram ограничил отправку, пауза {retry_after} с")
+                self._global_next = time.monotonic() + retry_after
+                self._pending.setdefault(chat_id, []).extend(items)
+                self._size += len(items)
+            else:
+                logger.error(f"Ошибка отправки в Telegram ({chat_id}): {e}")
+
+
+dispatcher = NotificationDispatcher()
+
+
+async def send_telegram_notification(text, chat_id=CHAT_ID):
+    """Отправляет сообщение в Telegram-бот (через очередь диспетчера, без ожидания)"""
+    dispatcher.notify(text, chat_id, priority=URGENT)
@@ -0,0 +1,236 @@
+import asyncio
+import time
+from bisect import bisect_left, insort
+import exchange
+from config import ORDER_BOOK_SYMBOLS, ORDER_BOOK_DEPTH, ORDER_BOOK_MAX_AGE
+from logger import logger
+from metrics import order_book_resyncs
+
+BUY = "BUY"
+SELL = "SELL"
+
+SNAPSHOT_ATTEMPTS = 5  # Сколько раз перезапрашивать снимок, если он старше первого события потока
+
+
+class _Side:
+    """
+    Уровни одной стороны книги: отсортированный список ключей и dict ключ -> объём.
+    Ключ — цена для bid и минус цена для ask, так что лучший уровень всегда последний:
+    лучшая цена читается за O(1), а изменения у вершины книги (самые частые) почти
+    не сдвигают список.
+    """
+
+    __slots__ = ("sign", "keys", "levels")
+
+    def __init__(self, sign):
+        self.sign = sign
+        self.keys = []
+        self.levels = {}
+
+    def clear(self):
+        self.keys.clear()
+        self.levels.clear()
+
+    def set(self, price, quantity):
+        key = price * self.sign
+        if quantity == 0:
+            if self.levels.pop(key, None) is not None:
+                del self.keys[bisect_left(self.keys, key)]
+        else:
+            if key not in self.levels:
+                insort(self.keys, key)
+            self.levels[key] = quantity
+
+    def best(self):
+        """(цена, объём) лучшего уровня или None"""
+        if not self.keys:
+            return None
+        key = self.keys[-1]
+        return key * self.sign, self.levels[key]
+
+    def quantity_at(self, price):
+        return self.levels.get(price * self.sign, 0.0)
+
+    def walk(self):
+        """Уровни от лучшего к худшему: (цена, объём)"""
+        levels = self.levels
+        for key in reversed(self.keys):
+            yield key * self.sign, levels[key]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class OrderBook:
+    """
+    Локальная книга заявок по инструменту: снимок REST + поток изменений <symbol>@depth@100ms.
+    Синхронизация по правилам Binance: события буферизуются, пока грузится снимок;
+    события с u <= lastUpdateId отбрасываются, первое применяемое должно покрывать
+    lastUpdateId + 1, дальше каждое следующее начинается с u + 1 предыдущего.
+    При разрыве последовательности книга помечается несинхронизированной и перезагружается.
+    Все изменения применяются в event loop, поэтому чтение не требует блокировок.
+    """
+
+    def __init__(self, symbol, depth=ORDER_BOOK_DEPTH, max_age=ORDER_BOOK_MAX_AGE):
+        self.symbol = symbol
+        self.depth = depth
+        self.max_age = max_age
+        self.bids = _Side(1)
+        self.asks = _Side(-1)
+        self.last_update_id = None
+        self.updated = 0.0        # time.monotonic() последнего применённого события
+        self.synced = False
+        self.resyncs = 0
+        self.loop = None
+        self.subscription = None
+        self._buffer = None       # События, пришедшие во время загрузки снимка
+        self._sync_task = None
+
+    def start(self, stream_manager):
+        """Подписывается на поток изменений и загружает снимок. Вызывать из event loop."""
+        self.loop = asyncio.get_running_loop()
+        # Колбэк в потоке WebSocket без схлопывания: пропуск события ломает книгу
+        self.subscription = stream_manager.subscribe(f"{self.symbol.lower()}@depth@100ms", callback=self._on_depth)
+        self._resync()
+
+    def stop(self, stream_manager):
+        if self.subscription is not None:
+            stream_manager.unsubscribe(self.subscription)
+            self.subscription = None
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+        self.synced = False
+
+    def _on_depth(self, msg):
+        self.loop.call_soon_threadsafe(self.on_event, msg)
+
+    def on_event(self, event):
+        """Событие depthUpdate из потока (в event loop)"""
+        if self._buffer is not None:
+            self._buffer.append(event)
+            return
+        if event["u"] <= self.last_update_id:
+            return  # Уже учтено в снимке
+        # Обычно U = предыдущий u + 1; первое событие после снимка может начинаться раньше
+        if event["U"] > self.last_update_id + 1:
+            logger.warning(f"Книга {self.symbol}: разрыв в потоке ({self.last_update_id} -> {event['U']}), "
+                           f"загружаем заново")
+            self._resync()
+            self._buffer.append(event)
+            return
+        self._apply(event)
+
+    def _apply(self, event):
+        for price, quantity in event["b"]:
+            self.bids.set(float(price), float(quantity))
+        for price, quantity in event["a"]:
+            self.asks.set(float(price), float(quantity))
+        self.last_update_id = event["u"]
+        self.updated = time.monotonic()
+
+    def _resync(self):
+        self.synced = False
+        self._buffer = []
+        self.resyncs += 1
+        order_book_resyncs.inc(self.symbol)
+        self._sync_task = asyncio.create_task(self._load_snapshot())
+
+    async def _load_snapshot(self):
+        try:
+            while not self._buffer:  # Сначала первое событие потока, потом снимок
+                await asyncio.sleep(0.1)
+            for _ in range(SNAPSHOT_ATTEMPTS):
+                snapshot = await exchange.get_order_book(self.symbol, self.depth)
+                # Снимок должен быть не старше первого события в буфере, иначе между ними дыра
+                if snapshot["lastUpdateId"] >= self._buffer[0]["U"] - 1:
+                    break
+            else:
+                raise RuntimeError("снимок всё время старше потока")
+
+            self.bids.clear()
+            self.asks.clear()
+            for price, quantity, *_ in snapshot["bids"]:
+                self.bids.set(float(price), float(quantity))
+            for price, quantity, *_ in snapshot["asks"]:
+                self.asks.set(float(price), float(quantity))
+            self.last_update_id = snapshot["lastUpdateId"]
+            self.updated = time.monotonic()
+
+            buffered, self._buffer = self._buffer, None
+            for event in buffered:
+                self.on_event(event)  # Старые события отбрасываются, разрывы проверяются как обычно
+            if self._buffer is None:
+                self.synced = True
+                logger.info(f"Книга {self.symbol}: {len(self.bids)} bid / {len(self.asks)} ask, "
+                            f"update {self.last_update_id}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Книга {self.symbol}: не удалось синхронизировать: {e}")
+            self.synced = False
+            self._buffer = []  # Пока ждём повтора, события копятся, а не применяются к сломанной книге
+            await asyncio.sleep(1)
+            self._resync()
+
+    def usable(self):
+        """Книга синхронизирована и обновлялась не позже max_age секунд назад"""
+        return self.synced and time.monotonic() - self.updated <= self.max_age
+
+    def best_bid(self):
+        """(цена, объём) лучшей заявки на покупку или None"""
+        return self.bids.best()
+
+    def best_ask(self):
+        """(цена, объём) лучшей заявки на продажу или None"""
+        return self.asks.best()
+
+    def spread(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return ask[0] - bid[0]
+
+    def quantity_at(self, price, side):
+        """Объём на уровне price стороны книги side ("bids"/"asks")"""
+        return getattr(self, side).quantity_at(price)
+
+    def depth_to(self, price, side):
+        """Суммарный объём стороны книги от лучшей цены до price включительно"""
+        book_side = getattr(self, side)
+        total = 0.0
+        for level, quantity in book_side.walk():
+            if (level - price) * book_side.sign < 0:
+                break
+            total += quantity
+        return total
+
+    def fill_price(self, order_side, quantity):
+        """
+        Худшая цена, по которой ордер order_side (BUY/SELL) на quantity исполнится
+        по текущей книге целиком: BUY проходит по ask, SELL — по bid.
+        None, если объёма в книге не хватает.
+        """
+        remaining = quantity
+        for price, level_quantity in (self.asks if order_side == BUY else self.bids).walk():
+            remaining -= level_quantity
+            if remaining <= 0:
+                return price
+        return None
+
+
+_books = {}
+
+
+def start_order_books(stream_manager, symbols=ORDER_BOOK_SYMBOLS):
+    """Запускает книги заявок для пар из конфига (вызывать из event loop)"""
+    for symbol in symbols:
+        if symbol not in _books:
+            book = _books[symbol] = OrderBook(symbol)
+            book.start(stream_manager)
+    return list(_books.values())
+
+
+def get_order_book(symbol):
+    """Книга заявок по паре, если она ведётся и сейчас пригодна, иначе None"""
+    book = _books.get(symbol)
+    return book if book is not None and book.usable() else None
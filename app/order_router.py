@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+import requests
+import exchange
+from notifications import send_telegram_notification
+from config import ORDER_WORKERS, ORDER_MAX_RETRIES, ORDER_BUDGET_SHARE
+from logger import logger
+
+# Лимиты Binance на случай, если exchangeInfo недоступен (формат rateLimits из exchangeInfo)
+DEFAULT_RATE_LIMITS = [
+    {"rateLimitType": "REQUEST_WEIGHT", "interval": "MINUTE", "intervalNum": 1, "limit": 6000},
+    {"rateLimitType": "ORDERS", "interval": "SECOND", "intervalNum": 10, "limit": 100},
+    {"rateLimitType": "ORDERS", "interval": "DAY", "intervalNum": 1, "limit": 200000},
+]
+INTERVAL_SECONDS = {"SECOND": 1, "MINUTE": 60, "HOUR": 3600, "DAY": 86400}
+
+# Вес запросов, которые делает роутер
+ORDER_WEIGHT = 1
+QUERY_ORDER_WEIGHT = 4
+
+# Коды ответа, после которых неизвестно, принят ли ордер
+UNKNOWN_STATUS_CODE = -1007  # Таймаут на стороне биржи
+NO_SUCH_ORDER_CODE = -2013
+
+
+class RateBucket:
+    """
+    Лимит вида «не больше limit за window секунд».
+    Окна выровнены по часам, как на бирже; счётчик сверяется с заголовками ответов
+    X-MBX-USED-WEIGHT-*/X-MBX-ORDER-COUNT-*, поэтому учитывает и чужие запросы с того же ключа/IP.
+    """
+
+    def __init__(self, header, limit, window):
+        self.header = header
+        self.limit = limit
+        self.window = window
+        self.window_start = 0
+        self.used = 0
+        self._lock = threading.Lock()  # sync() вызывается из потоков HTTP-клиента
+
+    def _roll(self, now):
+        start = now - now % self.window
+        if start != self.window_start:
+            self.window_start = start
+            self.used = 0
+
+    def sync(self, used, now=None):
+        """Значение из заголовка биржи; локальные резервы, ещё не дошедшие до биржи, не теряем"""
+        with self._lock:
+            self._roll(now or time.time())
+            self.used = max(self.used, used)
+
+    def wait_time(self, cost, now):
+        """Сколько ждать, пока в окне освободится cost единиц"""
+        with self._lock:
+            self._roll(now)
+            if self.used + cost <= self.limit:
+                return 0
+            return self.window_start + self.window - now
+
+    def take(self, cost, now):
+        with self._lock:
+            self._roll(now)
+            self.used += cost
+
+
+@dataclass
+class OrderIntent:
+    """Заявка на ордер в очереди роутера"""
+    symbol: str
+    side: str
+    quantity: object
+    price: object
+    chat_id: object = None
+    client_order_id: str = field(default_factory=lambda: f"bot-{uuid.uuid4().hex[:24]}")
+    future: asyncio.Future = None
+    attempts: int = 0
+    created: float = field(default_factory=time.monotonic)
+
+    def describe(self):
+        return f"{self.side} {self.quantity} {self.symbol} по {self.price}"
+
+
+class OrderRouter:
+    """
+    Очередь ордеров с учётом лимитов биржи.
+    Заявки исполняют несколько воркеров параллельно, пока позволяют бюджеты веса
+    и числа ордеров; при 429/418 все воркеры ждут Retry-After.
+    Повторы идут с тем же newClientOrderId, а после неоднозначной ошибки
+    (таймаут, 5xx) ордер сначала ищется на бирже, чтобы не выставить его дважды.
+    Результат сообщается в чат, из которого пришла заявка.
+    """
+
+    def __init__(self, workers=ORDER_WORKERS, max_retries=ORDER_MAX_RETRIES, budget_share=ORDER_BUDGET_SHARE):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.budget_share = budget_share
+        self.weight_buckets = []
+        self.order_buckets = []
+        self.banned_until = 0
+        self.configure(DEFAULT_RATE_LIMITS)
+        self.placed = 0
+        self.rejected = 0
+        self._queue = None
+        self._tasks = []
+        exchange.response_hooks.append(self._on_response)
+
+    def configure(self, rate_limits):
+        """Строит бюджеты по rateLimits из exchangeInfo"""
+        weight_buckets, order_buckets = [], []
+        for rate_limit in rate_limits:
+            window = INTERVAL_SECONDS[rate_limit["interval"]] * rate_limit["intervalNum"]
+            suffix = f"{rate_limit['intervalNum']}{rate_limit['interval'][0].lower()}"
+            limit = int(rate_limit["limit"] * self.budget_share)
+            if rate_limit["rateLimitType"] == "REQUEST_WEIGHT":
+                weight_buckets.append(RateBucket(f"x-mbx-used-weight-{suffix}", limit, window))
+            elif rate_limit["rateLimitType"] == "ORDERS":
+                order_buckets.append(RateBucket(f"x-mbx-order-count-{suffix}", limit, window))
+        self.weight_buckets, self.order_buckets = weight_buckets, order_buckets
+
+    def _on_response(self, response, *args, **kwargs):
+        """Хук requests: сверяет бюджеты с заголовками каждого ответа биржи"""
+        now = time.time()
+        for bucket in self.weight_buckets + self.order_buckets:
+            used = response.headers.get(bucket.header)
+            if used is not None:
+                bucket.sync(int(used), now)
+        if response.status_code in (418, 429):
+            retry_after = int(response.headers.get("Retry-After", 60))
+            self.banned_until = max(self.banned_until, now + retry_after)
+            logger.warning(f"Биржа ограничила запросы ({response.status_code}), пауза {retry_after} с")
+
+    async def _acquire(self, weight, orders=0):
+        """Ждёт, пока запрос укладывается во все бюджеты, и резервирует его"""
+        while True:
+            now = time.time()
+            wait = max([self.banned_until - now]
+                       + [bucket.wait_time(weight, now) for bucket in self.weight_buckets]
+                       + [bucket.wait_time(orders, now) for bucket in self.order_buckets if orders])
+            if wait <= 0:
+                for bucket in self.weight_buckets:
+                    bucket.take(weight, now)
+                for bucket in self.order_buckets if orders else ():
+                    bucket.take(orders, now)
+                return
+            await asyncio.sleep(wait)
+
+    async def start(self):
+        """Загружает лимиты биржи и запускает воркеров; вызывается при первой заявке"""
+        try:
+            await self._acquire(20)
+            info = await exchange.get_exchange_info()
+            self.configure(info["rateLimits"])
+        except Exception as e:
+            logger.error(f"Не удалось загрузить лимиты биржи, используем стандартные: {e}")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, symbol, side, quantity, price, chat_id=None):
+        """
+        Ставит ордер в очередь и сразу возвращает заявку.
+        intent.future завершится ответом биржи или ошибкой.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            asyncio.get_running_loop().create_task(self.start())
+        intent = OrderIntent(symbol, side, quantity, price, chat_id)
+        intent.future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(intent)
+        return intent
+
+    async def _worker(self):
+        while True:
+            intent = await self._queue.get()
+            try:
+                await self._process(intent)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Что бы ни случилось с одной заявкой, воркер продолжает разбирать очередь
+                logger.error(f"Сбой обработки ордера {intent.describe()}: {e}")
+
+    async def _process(self, intent):
+        # Ожидавший intent.future мог быть отменён (вместе с ним отменяется и future),
+        # а ордер на бирже всё равно размещается — результат тогда просто некому отдать
+        try:
+            order = await self._execute(intent)
+        except Exception as e:
+            self.rejected += 1
+            if not intent.future.done():
+                intent.future.set_exception(e)
+                intent.future.exception()  # Ошибка уже сообщена в чат, ждать её не обязательно
+            logger.error(f"Ошибка при размещении ордера {intent.describe()}: {e}")
+            await self._report(intent, f"❌ Ордер {intent.describe()} не размещен: {e}")
+            return
+        self.placed += 1
+        if not intent.future.done():
+            intent.future.set_result(order)
+        logger.info(f"Ордер размещен: {order}")
+        await self._report(intent, f"✅ Ордер {intent.describe()} размещен: {order['status']}, "
+                                   f"ID {order['orderId']}")
+
+    async def _execute(self, intent):
+        from binance.exceptions import BinanceAPIException  # ОТЛОЖЕННЫЙ ИМПОРТ: python-binance тяжёлый
+        uncertain = False  # Прошлая попытка могла дойти до биржи
+        while True:
+            intent.attempts += 1
+            try:
+                if uncertain:
+                    order = await self._lookup(intent)
+                    if order is not None:
+                        return order
+                await self._acquire(ORDER_WEIGHT, orders=1)
+                return await exchange.create_order(
+                    symbol=intent.symbol,
+                    side=intent.side,
+                    type="LIMIT",
+                    timeInForce="GTC",
+                    quantity=intent.quantity,
+                    price=str(intent.price),
+                    newClientOrderId=intent.client_order_id,
+                )
+            except BinanceAPIException as e:
+                if e.status_code in (418, 429):
+                    uncertain = False  # Запрос отклонён лимитером, ордера точно нет
+                elif e.status_code >= 500 or e.code == UNKNOWN_STATUS_CODE:
+                    uncertain = True
+                else:
+                    raise  # Ошибка в самом ордере: баланс, фильтры цены и т.п.
+                if intent.attempts > self.max_retries:
+                    raise
+            except requests.exceptions.RequestException:
+                uncertain = True
+                if intent.attempts > self.max_retries:
+                    raise
+            await asyncio.sleep(min(0.5 * 2 ** intent.attempts, 10))
+
+    async def _lookup(self, intent):
+        """Ордер с нашим clientOrderId на бирже или None, если его нет"""
+        from binance.exceptions import BinanceAPIException
+        await self._acquire(QUERY_ORDER_WEIGHT)
+        try:
+            return await exchange.get_order(symbol=intent.symbol, origClientOrderId=intent.client_order_id)
+        except BinanceAPIException as e:
+            if e.code == NO_SUCH_ORDER_CODE:
+                return None
+            raise
+
+    async def _report(self, intent, text):
+        if intent.chat_id is None:
+            return
+        try:
+            await send_telegram_notification(text, chat_id=intent.chat_id)
+        except Exception as e:
+            logger.error(f"Не удалось сообщить о результате ордера: {e}")
+
+
+order_router = OrderRouter()
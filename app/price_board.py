@@ -0,0 +1,99 @@
+import time
+from config import PRICE_SYMBOLS, PRICE_MAX_AGE
+
+
+class Quote:
+    """Последние цена и лучшие bid/ask по инструменту; ts — time.monotonic() получения"""
+
+    __slots__ = ("symbol", "price", "bid", "ask", "price_ts", "book_ts")
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.price = None
+        self.bid = None
+        self.ask = None
+        self.price_ts = 0.0
+        self.book_ts = 0.0
+
+
+class PriceBoard:
+    """
+    Табло цен в памяти, которое постоянно обновляется из потоков ticker и bookTicker.
+    Обработчики работают прямо в потоке WebSocket и только присваивают поля,
+    так что чтение цены — это поиск в словаре без обращения к сети.
+    Цена старше max_age секунд считается устаревшей (поток отвалился) и не отдаётся.
+    """
+
+    def __init__(self, max_age=PRICE_MAX_AGE):
+        self.max_age = max_age
+        self._quotes = {}
+        self._subscriptions = []
+
+    def start(self, stream_manager, symbols=PRICE_SYMBOLS):
+        for symbol in symbols:
+            self._quotes.setdefault(symbol, Quote(symbol))
+            stream = symbol.lower()
+            self._subscriptions.append(stream_manager.subscribe(f"{stream}@ticker", callback=self._on_ticker))
+            self._subscriptions.append(stream_manager.subscribe(f"{stream}@bookTicker", callback=self._on_book))
+
+    def stop(self, stream_manager):
+        for subscription in self._subscriptions:
+            stream_manager.unsubscribe(subscription)
+        self._subscriptions = []
+
+    def _on_ticker(self, msg):
+        quote = self._quotes.get(msg["s"])
+        if quote is not None:
+            quote.price = float(msg["c"])
+            quote.price_ts = time.monotonic()
+
+    def _on_book(self, msg):
+        quote = self._quotes.get(msg["s"])
+        if quote is not None:
+            quote.bid = float(msg["b"])
+            quote.ask = float(msg["a"])
+            quote.book_ts = time.monotonic()
+
+    def quote(self, symbol):
+        """Quote как есть, вместе с временем получения; None, если инструмент не отслеживается"""
+        return self._quotes.get(symbol)
+
+    def export(self):
+        """Цены для снимка: {symbol: (price, bid, ask, время цены, время bid/ask)}, время — time.time()"""
+        offset = time.time() - time.monotonic()
+        return {symbol: (q.price, q.bid, q.ask, q.price_ts + offset, q.book_ts + offset)
+                for symbol, q in self._quotes.items() if q.price is not None}
+
+    def restore(self, quotes):
+        """
+        Цены из снимка вместе с их настоящим возрастом: price() и book() не отдадут их,
+        пока поток не пришлёт свежие, но quote() покажет последнюю известную цену.
+        """
+        offset = time.monotonic() - time.time()
+        for symbol, (price, bid, ask, price_time, book_time) in quotes.items():
+            quote = self._quotes.setdefault(symbol, Quote(symbol))
+            if quote.price is None:
+                quote.price, quote.bid, quote.ask = price, bid, ask
+                quote.price_ts = price_time + offset
+                quote.book_ts = book_time + offset
+
+    def price(self, symbol, max_age=None):
+        """Последняя цена сделки или None, если её нет или она старше max_age секунд"""
+        quote = self._quotes.get(symbol)
+        if quote is None or quote.price is None:
+            return None
+        if time.monotonic() - quote.price_ts > (self.max_age if max_age is None else max_age):
+            return None
+        return quote.price
+
+    def book(self, symbol, max_age=None):
+        """Лучшие (bid, ask) или None, если данных нет или они устарели"""
+        quote = self._quotes.get(symbol)
+        if quote is None or quote.bid is None:
+            return None
+        if time.monotonic() - quote.book_ts > (self.max_age if max_age is None else max_age):
+            return None
+        return quote.bid, quote.ask
+
+
+price_board = PriceBoard()
@@ -0,0 +1,78 @@
+import asyncio
+import numpy as np
+import pandas as pd
+import exchange
+import kernels
+from config import SCAN_QUOTE, SCAN_INTERVAL, SCAN_LIMIT, EXCHANGE_WORKERS
+from logger import logger
+
+
+async def get_symbols(quote=SCAN_QUOTE):
+    """Все торгуемые пары к валюте quote"""
+    info = await exchange.get_exchange_info()
+    return [s["symbol"] for s in info["symbols"] if s["quoteAsset"] == quote and s["status"] == "TRADING"]
+
+
+async def load_candles(symbols, interval=SCAN_INTERVAL, limit=SCAN_LIMIT):
+    """
+    Загружает свечи по всем инструментам параллельно и складывает их в матрицы
+    (инструменты × время). Инструменты с неполной историей отбрасываются.
+    :return: (список инструментов, closes, volumes)
+    """
+    semaphore = asyncio.Semaphore(EXCHANGE_WORKERS)
+
+    async def load(symbol):
+        async with semaphore:
+            try:
+                return await exchange.get_klines(symbol, interval, limit)
+            except Exception as e:
+                logger.error(f"Сканер: не удалось загрузить {symbol}: {e}")
+                return None
+
+    results = await asyncio.gather(*(load(symbol) for symbol in symbols))
+
+    loaded = [(symbol, klines) for symbol, klines in zip(symbols, results) if klines and len(klines) == limit]
+    closes = np.empty((len(loaded), limit))
+    volumes = np.empty((len(loaded), limit))
+    for i, (_, klines) in enumerate(loaded):
+        closes[i] = [k[4] for k in klines]
+        volumes[i] = [k[5] for k in klines]
+    return [symbol for symbol, _ in loaded], closes, volumes
+
+
+def scan_arrays(symbols, closes, volumes, window=20, std_dev=2, periods=14, drop_threshold=5, period=10,
+                volume_multiplier=1.5):
+    """
+    Считает Боллинджер, RSI и разворот после падения сразу для всех инструментов
+    одним векторным проходом и возвращает таблицу, отсортированную по силе сигнала на покупку.
+    """
+    upper, middle, lower = (band[:, -1] for band in kernels.bollinger(closes, window, std_dev))
+    rsi = kernels.rsi(closes, periods)[:, -1]
+    crash = kernels.crash_reversal(closes, volumes, drop_threshold, period, volume_multiplier)[:, -1]
+    close = closes[:, -1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent_b = (close - lower) / (upper - lower)  # Положение цены внутри полос: 0 — нижняя, 1 — верхняя
+
+    table = pd.DataFrame({
+        "symbol": symbols,
+        "close": close,
+        "upper": upper,
+        "middle": middle,
+        "lower": lower,
+        "percent_b": percent_b,
+        "rsi": rsi,
+        "crash_reversal": crash,
+        "buy_signal": (close < lower) & (rsi < 30),
+        "sell_signal": (close > upper) & (rsi > 70),
+    })
+    return table.sort_values(["crash_reversal", "buy_signal", "rsi"], ascending=[False, False, True],
+                             ignore_index=True)
+
+
+async def scan_market(symbols=None, interval=SCAN_INTERVAL, limit=SCAN_LIMIT, **params):
+    """Сканирует рынок: по умолчанию все пары к SCAN_QUOTE"""
+    if symbols is None:
+        symbols = await get_symbols()
+    symbols, closes, volumes = await load_candles(symbols, interval, limit)
+    return scan_arrays(symbols, closes, volumes, **params)
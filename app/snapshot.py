@@ -0,0 +1,120 @@
+import asyncio
+import os
+import pickle
+import time
+import zlib
+from aggregator import export_aggregators, restore_aggregators
+from config import SNAPSHOT_FILE, SNAPSHOT_INTERVAL
+from kline_cache import kline_cache
+from logger import logger
+from price_board import price_board
+from stream_indicators import export_engines, restore_engines
+from triggers import trigger_book
+
+SNAPSHOT_VERSION = 1  # Меняется, когда формат состояния перестаёт читаться старым кодом
+
+
+class Snapshotter:
+    """
+    Снимок состояния бота в памяти для быстрого перезапуска: буферы свечей, потоковые индикаторы,
+    текущие периоды агрегатора, триггеры авто-продажи и последние цены.
+    Раз в interval секунд состояние копируется в event loop (только ссылки и мелкие объекты),
+    а сериализация, сжатие и атомарная запись файла идут в пуле потоков.
+    После рестарта всё это загружается до подключения к бирже, и дальше докачиваются
+    только свечи, вышедшие после снимка.
+    """
+
+    def __init__(self, path=SNAPSHOT_FILE, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.extra = None     # Функция, возвращающая флаги самого бота (словарь)
+        self.restored = False  # Пока снимок не прочитан, писать нельзя: затрём его пустым состоянием
+        self.saved = None     # time.time() последней записи
+
+    def capture(self):
+        """Состояние на текущий момент; вызывать из event loop"""
+        return {
+            "version": SNAPSHOT_VERSION,
+            "saved": time.time(),
+            "klines": kline_cache.export(),
+            "engines": export_engines(),
+            "aggregators": export_aggregators(),
+            "triggers": trigger_book.export(),
+            "prices": price_board.export(),
+            "bot": self.extra() if self.extra else {},
+        }
+
+    def write(self, state):
+        """Сжимает и атомарно перезаписывает файл снимка"""
+        data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+        self.saved = state["saved"]
+        return len(data)
+
+    def save(self):
+        """Синхронная запись (при завершении процесса)"""
+        if not self.restored:
+            return
+        try:
+            self.write(self.capture())
+        except Exception as e:
+            logger.error(f"Не удалось сохранить снимок состояния: {e}")
+
+    def load(self):
+        """Читает снимок; None, если его нет, он битый или другой версии"""
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Снимок состояния {self.path} не читается, стартуем с нуля: {e}")
+            return None
+        if not isinstance(state, dict) or state.get("version") != SNAPSHOT_VERSION:
+            logger.warning(f"Снимок состояния {self.path} другой версии, стартуем с нуля")
+            return None
+        return state
+
+    def restore(self, state):
+        """
+        Раскладывает снимок по модулям. Вызывать до start_background: подписки и докачка
+        разрыва начинаются уже с восстановленным состоянием. Возвращает флаги бота.
+        """
+        self.restored = True
+        if state is None:
+            return {}
+        restored = []
+        for name, apply in (("klines", kline_cache.restore), ("engines", restore_engines),
+                            ("aggregators", restore_aggregators), ("triggers", trigger_book.restore),
+                            ("prices", price_board.restore)):
+            try:
+                apply(state[name])
+                restored.append(name)
+            except Exception as e:
+                logger.error(f"Снимок состояния: не удалось восстановить {name}: {e}")
+        logger.info(f"Состояние восстановлено из снимка {time.time() - state['saved']:.0f} с назад: "
+                    f"{', '.join(restored)}; свечей в кэше — {sum(map(len, state['klines'].values()))}, "
+                    f"триггеров — {len(state['triggers'])}")
+        return state.get("bot", {})
+
+    async def warm_start(self, extra=None):
+        """Читает снимок в пуле потоков и восстанавливает состояние; возвращает флаги бота"""
+        self.extra = extra
+        state = await asyncio.get_running_loop().run_in_executor(None, self.load)
+        return self.restore(state)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, self.write, self.capture())
+            except Exception as e:
+                logger.error(f"Не удалось сохранить снимок состояния: {e}")
+
+
+snapshotter = Snapshotter()
@@ -0,0 +1,312 @@
+import math
+import pickle
+import time
+from collections import deque
+from indicators import bollinger_signal, rsi_signal, combine_signals
+from kline_cache import kline_cache, INTERVAL_MS
+
+# Раз в сколько обновлений пересчитывать накопленные суммы заново,
+# чтобы ошибка округления не копилась бесконечно
+RESUM_EVERY = 1000
+
+
+class RollingBollinger:
+    """
+    Полосы Боллинджера за O(1) на свечу: скользящие сумма и сумма квадратов.
+    Совпадает с bollinger_bands (стандартное отклонение с ddof=1, как в pandas).
+    """
+
+    def __init__(self, window=20, std_dev=2):
+        self.window = window
+        self.std_dev = std_dev
+        self._values = deque(maxlen=window)
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._updates = 0
+
+    def seed(self, closes):
+        for close in closes:
+            self.update(close)
+
+    def update(self, close):
+        """Добавляет закрытую свечу"""
+        if len(self._values) == self.window:
+            oldest = self._values[0]
+            self._sum -= oldest
+            self._sumsq -= oldest * oldest
+        self._values.append(close)
+        self._sum += close
+        self._sumsq += close * close
+        self._updates += 1
+        if self._updates % RESUM_EVERY == 0:
+            self._sum = math.fsum(self._values)
+            self._sumsq = math.fsum(v * v for v in self._values)
+
+    def bands(self, price=None):
+        """
+        (верхняя, средняя, нижняя) полосы.
+        Если передана price — считаем, что это цена закрытия формирующейся свечи,
+        и она замещает самую старую свечу окна (состояние при этом не меняется).
+        """
+        total, total_sq, n = self._sum, self._sumsq, len(self._values)
+        if price is not None:
+            if n == self.window:
+                oldest = self._values[0]
+                total -= oldest
+                total_sq -= oldest * oldest
+            else:
+                n += 1
+            total += price
+            total_sq += price * price
+        if n < self.window:
+            return None
+        mean = total / n
+        std = math.sqrt(max(total_sq - total * mean, 0.0) / (n - 1))
+        return mean + std * self.std_dev, mean, mean - std * self.std_dev
+
+    def signal(self, price):
+        """Текст сигнала пробоя полос для цены price, как в is_price_outside_bollinger"""
+        bands = self.bands(price)
+        if bands is None:
+            return None
+        upper, _, lower = bands
+        return bollinger_signal(price, upper, lower)
+
+
+class StreamingRSI:
+    """
+    RSI за O(1) на свечу.
+    wilder=True — классическое сглаживание Уайлдера,
+    wilder=False — простое скользящее среднее приростов/потерь, как в calculate_rsi.
+    """
+
+    def __init__(self, periods=14, wilder=True):
+        self.periods = periods
+        self.wilder = wilder
+        self._last_close = None
+        self._gains = deque(maxlen=periods)
+        self._losses = deque(maxlen=periods)
+        self._gain_sum = 0.0
+        self._loss_sum = 0.0
+        self._avg_gain = None
+        self._avg_loss = None
+        self._updates = 0
+
+    def seed(self, closes):
+        for close in closes:
+            self.update(close)
+
+    def update(self, close):
+        """Добавляет закрытую свечу"""
+        if self._last_close is not None:
+            self._avg_gain, self._avg_loss = self._step(close - self._last_close, commit=True)
+        self._last_close = close
+
+    def _step(self, delta, commit):
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        n = len(self._gains)
+
+        if self.wilder and self._avg_gain is not None:
+            avg_gain = (self._avg_gain * (self.periods - 1) + gain) / self.periods
+            avg_loss = (self._avg_loss * (self.periods - 1) + loss) / self.periods
+            return avg_gain, avg_loss
+
+        # Простое среднее по окну (для Уайлдера — только до первого полного окна)
+        gain_sum, loss_sum = self._gain_sum + gain, self._loss_sum + loss
+        if n == self.periods:
+            gain_sum -= self._gains[0]
+            loss_sum -= self._losses[0]
+        if commit:
+            self._gains.append(gain)
+            self._losses.append(loss)
+            self._gain_sum, self._loss_sum = gain_sum, loss_sum
+            self._updates += 1
+            if self._updates % RESUM_EVERY == 0:
+                self._gain_sum = math.fsum(self._gains)
+                self._loss_sum = math.fsum(self._losses)
+        if n + 1 < self.periods:
+            return None, None
+        return gain_sum / self.periods, loss_sum / self.periods
+
+    def value(self, price=None):
+        """
+        Текущее значение RSI (None, пока мало данных).
+        Если передана price — RSI с учётом формирующейся свечи, без изменения состояния.
+        """
+        if price is None or self._last_close is None:
+            avg_gain, avg_loss = self._avg_gain, self._avg_loss
+        else:
+            avg_gain, avg_loss = self._step(price - self._last_close, commit=False)
+        if avg_gain is None:
+            return None
+        if avg_loss == 0:
+            return 100.0 if avg_gain > 0 else None
+        return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+class CrashReversalDetector:
+    """
+    Потоковая версия detect_crash_reversal: окно цен закрытия длиной period
+    и два окна объёмов (до и после) с накопленными суммами.
+    """
+
+    def __init__(self, period=10, volume_multiplier=1.5):
+        self.period = period
+        self.volume_multiplier = volume_multiplier
+        self._closes = deque(maxlen=period)
+        self._before = deque()
+        self._after = deque()
+        self._before_sum = 0.0
+        self._after_sum = 0.0
+
+    def seed(self, closes, volumes):
+        for close, volume in zip(closes, volumes):
+            self.update(close, volume)
+
+    def update(self, close, volume):
+        """Добавляет закрытую свечу"""
+        self._closes.append(close)
+        self._after.append(volume)
+        self._after_sum += volume
+        if len(self._after) > self.period:
+            moved = self._after.popleft()
+            self._after_sum -= moved
+            self._before.append(moved)
+            self._before_sum += moved
+            if len(self._before) > self.period:
+                self._before_sum -= self._before.popleft()
+
+    def detected(self, drop_threshold=5, close=None, volume=None):
+        """
+        True, если за period свечей было падение больше drop_threshold%
+        и средний объём вырос в volume_multiplier раз.
+        close/volume — данные формирующейся свечи (учитываются без изменения состояния).
+        """
+        closes, after, after_sum = self._closes, self._after, self._after_sum
+        before, before_sum = self._before, self._before_sum
+
+        if close is None:
+            if not closes:
+                return False
+            first, last = closes[0], closes[-1]
+            after_len = len(after)
+            before_len = len(before)
+        else:
+            # Формирующаяся свеча сдвигает все окна на одну позицию
+            first = closes[1] if len(closes) == self.period and self.period > 1 else (closes[0] if closes else close)
+            last = close
+            after_sum += volume
+            after_len = len(after) + 1
+            before_len = len(before)
+            if after_len > self.period:
+                moved = after[0]
+                after_sum -= moved
+                after_len -= 1
+                before_sum += moved
+                before_len += 1
+                if before_len > self.period:
+                    before_sum -= before[0]
+                    before_len -= 1
+
+        price_change = (last - first) / first * 100
+        if price_change < -drop_threshold and before_len:
+            return after_sum / after_len > before_sum / before_len * self.volume_multiplier
+        return False
+
+
+class IndicatorEngine:
+    """
+    Набор потоковых индикаторов для одной пары (symbol, interval).
+    Закрытые свечи применяются по одной, формирующаяся свеча и тики
+    учитываются «на лету», поэтому сигнал можно пересчитывать на каждом тике.
+    """
+
+    def __init__(self, symbol, interval, window=20, std_dev=2, periods=14, crash_period=10, volume_multiplier=1.5):
+        self.symbol = symbol
+        self.interval = interval
+        self.bollinger = RollingBollinger(window, std_dev)
+        # Простое среднее, чтобы значения совпадали с calculate_rsi и кнопкой «RSI»
+        self.rsi = StreamingRSI(periods, wilder=False)
+        self.crash = CrashReversalDetector(crash_period, volume_multiplier)
+        self.last_closed_open_time = None
+        self.last_close = None
+        self.price = None  # Цена закрытия формирующейся свечи (или последнего тика)
+        self.volume = None  # Объём формирующейся свечи
+
+    def on_candle(self, close, volume):
+        """Закрытая свеча"""
+        self.bollinger.update(close)
+        self.rsi.update(close)
+        self.crash.update(close, volume)
+        self.last_close = close
+
+    def on_tick(self, price):
+        """Новая цена внутри формирующейся свечи"""
+        self.price = price
+
+    def sync(self, rows):
+        """
+        Применяет свечи в формате REST get_klines, которых движок ещё не видел.
+        Закрытые свечи коммитятся, последняя незакрытая становится текущей.
+        """
+        now_ms = time.time() * 1000
+        for row in rows:
+            open_time = row[0]
+            if self.last_closed_open_time is not None and open_time <= self.last_closed_open_time:
+                continue
+            if row[6] < now_ms:
+                self.on_candle(float(row[4]), float(row[5]))
+                self.last_closed_open_time = open_time
+                self.price = self.volume = None
+            else:
+                self.price = float(row[4])
+                self.volume = float(row[5])
+
+    def analysis(self):
+        """Текст анализа рынка в том же формате, что и combined_market_analysis"""
+        current = self.price
+        bands = self.bollinger.bands(current)
+        rsi = self.rsi.value(current)
+        price = current if current is not None else self.last_close
+        if bands is None or rsi is None:
+            return "⚪ Недостаточно данных для анализа"
+        upper, _, lower = bands
+        return combine_signals(bollinger_signal(price, upper, lower), rsi_signal(rsi))
+
+    def crash_reversal(self, drop_threshold=5):
+        """Сигнал резкого падения и разворота с учётом формирующейся свечи"""
+        if self.price is None:
+            return self.crash.detected(drop_threshold)
+        return self.crash.detected(drop_threshold, self.price, self.volume or 0.0)
+
+
+_engines = {}
+
+
+async def get_engine(symbol, interval, history=100):
+    """
+    Возвращает движок индикаторов для пары, досинхронизированный с кэшем свечей.
+    Первый вызов засевает его историей, дальше применяются только новые свечи.
+    """
+    key = (symbol, interval)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = _engines[key] = IndicatorEngine(symbol, interval)
+    rows = await kline_cache.get(symbol, interval, history)
+    last = engine.last_closed_open_time
+    if last is not None and rows and rows[0][0] > last + INTERVAL_MS.get(interval, 0):
+        # Движок (например, из снимка) отстал больше, чем на history свечей — засеваем заново
+        engine = _engines[key] = IndicatorEngine(symbol, interval)
+    engine.sync(rows)
+    return engine
+
+
+def export_engines():
+    """Состояние всех движков для снимка (сериализуется сразу: движки меняются на каждой свече)"""
+    return pickle.dumps(_engines, pickle.HIGHEST_PROTOCOL)
+
+
+def restore_engines(data):
+    """Восстанавливает движки из снимка; get_engine досинхронизирует их с кэшем свечей"""
+    _engines.update(pickle.loads(data))
@@ -0,0 +1,260 @@
+import asyncio
+import functools
+import threading
+import time
+from config import STREAM_QUEUE_SIZE, STREAM_BATCH_DELAY, STREAM_CHECK_INTERVAL, STREAM_MAX_BACKOFF
+from logger import logger
+from metrics import stream_reconnects
+
+# Ошибки, после которых python-binance переподключается сам; остальные (исчерпаны
+# переподключения, переполнена очередь, закрыт цикл чтения) означают, что сокет мёртв
+RECOVERABLE_ERRORS = {"IncompleteReadError", "gaierror", "ConnectionClosedError", "ConnectionClosedOK",
+                      "BinanceWebsocketClosed"}
+
+
+class Subscription:
+    """
+    Подписка на один поток Binance (например, "btcusdt@ticker").
+    Сообщения доставляются одним из способов:
+    - callback в потоке WebSocket;
+    - callback в event loop из параметра loop: пачка сообщений, пришедших, пока loop был занят,
+      схлопывается до последнего (без создания задач на каждое сообщение);
+    - ограниченная asyncio.Queue в event loop подписчика,
+      при переполнении выбрасывается самое старое сообщение.
+    """
+
+    def __init__(self, stream, callback=None, maxsize=STREAM_QUEUE_SIZE, loop=None):
+        self.stream = stream
+        self.callback = callback
+        self.dropped = 0
+        self.queue = None
+        self._loop = loop
+        self._latest = None
+        self._scheduled = False
+        self._handoff = threading.Lock()  # _latest/_scheduled/dropped меняют поток WebSocket и event loop
+        if callback is None:
+            self._loop = asyncio.get_running_loop()
+            self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, data):
+        if self._loop is not None and self._loop.is_closed():
+            return
+        if self.queue is not None:
+            self._loop.call_soon_threadsafe(self._put, data)
+        elif self._loop is not None:
+            with self._handoff:
+                self._latest = data
+                if self._scheduled:
+                    self.dropped += 1
+                    return
+                self._scheduled = True
+            self._loop.call_soon_threadsafe(self._run_latest)
+        else:
+            self._run(data)
+
+    def _run_latest(self):
+        with self._handoff:
+            self._scheduled = False
+            data, self._latest = self._latest, None
+        self._run(data)
+
+    def _run(self, data):
+        try:
+            self.callback(data)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика потока {self.stream}: {e}")
+
+    def _put(self, data):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+
+    async def get(self):
+        """Следующее сообщение (только для подписок без callback)"""
+        return await self.queue.get()
+
+
+class StreamManager:
+    """
+    Одно WebSocket-соединение на процесс: все подписки собираются в combined stream,
+    а входящие сообщения раздаются подписчикам.
+    Всё управление python-binance (запуск менеджера, открытие и закрытие сокета)
+    идёт в отдельном служебном потоке: его вызовы блокируют, и им нельзя
+    выполняться в event loop. subscribe/unsubscribe только меняют список потоков
+    и будят служебный поток; изменения за STREAM_BATCH_DELAY собираются в одно
+    переоткрытие соединения. Если python-binance сдался (исчерпал переподключения,
+    переполнил очередь) или поток менеджера упал, соединение открывается заново
+    с паузой, растущей до STREAM_MAX_BACKOFF.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._twm = None
+        self._socket = None
+        self._socket_streams = []  # Потоки, с которыми открыт текущий сокет
+        self._subscribers = {}  # stream -> [Subscription]
+        self._generation = 0     # Номер текущего сокета: сообщения старого после переоткрытия не раздаются
+        self._fresh = False      # Текущий сокет уже прислал первое сообщение
+        self._broken = False     # python-binance перестал переподключаться сам
+        self._failures = 0       # Переоткрытий подряд без единого сообщения
+        self._running = False
+        self._worker = None
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+
+    @property
+    def streams(self):
+        return sorted(self._subscribers)
+
+    def start(self, timeout=10):
+        """Запускает служебный поток и ждёт готовности менеджера (блокирует, вызывать вне event loop)"""
+        self._ensure_worker()
+        if not self._ready.wait(timeout):
+            logger.warning(f"WebSocket менеджер не запустился за {timeout} с, продолжаем в фоне")
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            worker = self._worker
+        self._wake.set()
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout=10)
+
+    def subscribe(self, stream, callback=None, maxsize=STREAM_QUEUE_SIZE, loop=None):
+        """Подписывает на поток; без callback нужно вызывать из event loop. Не блокирует."""
+        subscription = Subscription(stream.lower(), callback, maxsize, loop)
+        with self._lock:
+            subscribers = self._subscribers.setdefault(subscription.stream, [])
+            subscribers.append(subscription)
+            if len(subscribers) == 1:
+                self._wake.set()
+        self._ensure_worker()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.stream, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers and subscription.stream in self._subscribers:
+                del self._subscribers[subscription.stream]
+                self._wake.set()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._running = True
+            self._worker = threading.Thread(target=self._run, name="stream-manager", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        """Служебный поток: приводит соединение к нужному списку потоков"""
+        while self._running:
+            self._wake.wait(STREAM_CHECK_INTERVAL)
+            if not self._running:
+                break
+            if self._wake.is_set():
+                time.sleep(STREAM_BATCH_DELAY)  # Подписки, сделанные вместе (старт бота), — одним открытием
+            self._wake.clear()
+            try:
+                self._sync()
+            except Exception as e:
+                logger.error(f"WebSocket: не удалось обновить подписки: {e}")
+                self._wake.set()  # Повторим после паузы
+                self._backoff()
+        self._shutdown()
+
+    def _backoff(self):
+        delay = min(2 ** self._failures, STREAM_MAX_BACKOFF)
+        self._failures += 1
+        time.sleep(delay)
+
+    def _sync(self):
+        if self._twm is None or not self._twm.is_alive():
+            if self._twm is not None:
+                logger.warning("WebSocket менеджер остановился, перезапускаем")
+                stream_reconnects.inc("manager")
+            # Свой event loop: в этом потоке python-binance иначе возьмёт чужой или уже закрытый
+            from binance import ThreadedWebsocketManager  # ОТЛОЖЕННЫЙ ИМПОРТ: python-binance тяжёлый
+            self._twm = ThreadedWebsocketManager(loop=asyncio.new_event_loop(), max_queue_size=STREAM_QUEUE_SIZE)
+            self._twm.start()
+            self._socket = None
+        self._ready.set()
+
+        if self._broken:
+            # Слушатель мёртвого сокета крутится вхолостую, закрываем его сразу, а открываем после паузы
+            self._broken = False
+            self._close_socket()
+            self._backoff()
+            logger.warning("WebSocket: переоткрываем соединение")
+
+        streams = self.streams
+        if streams == self._socket_streams and (self._socket or not streams):
+            return
+        old = self._socket
+        self._socket, self._socket_streams = None, []
+        if streams:
+            # Новый сокет открывается до закрытия старого: старый раздаёт сообщения,
+            # пока новый не прислал первое, так что при смене списка ничего не теряется и не дублируется
+            self._generation += 1
+            self._fresh = False
+            self._socket = self._twm.start_multiplex_socket(callback=functools.partial(self._handle, self._generation),
+                                                            streams=streams)
+            self._socket_streams = streams
+            logger.info(f"WebSocket подписки: {', '.join(streams)}")
+        if old:
+            self._twm.stop_socket(old)
+
+    def _close_socket(self, timeout=5):
+        """Закрывает текущий сокет и ждёт остановки его слушателя (тот же путь нельзя открыть, пока он жив)"""
+        socket, self._socket, self._socket_streams = self._socket, None, []
+        if not socket:
+            return
+        self._twm.stop_socket(socket)
+        deadline = time.monotonic() + timeout
+        while socket in self._twm._socket_running and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def _shutdown(self):
+        if self._twm is not None:
+            self._twm.stop()
+        self._twm = None
+        self._socket = None
+        self._socket_streams = []
+        self._ready.clear()
+
+    def _handle(self, generation, msg):
+        if msg.get("e") == "error":
+            self._on_error(generation, msg)
+            return
+        if generation != self._generation:
+            if self._fresh:
+                return  # Новый сокет уже работает
+        elif not self._fresh:
+            self._fresh = True
+            self._failures = 0
+        with self._lock:
+            subscribers = list(self._subscribers.get(msg.get("stream"), ()))
+        for subscription in subscribers:
+            subscription.deliver(msg["data"])
+
+    def _on_error(self, generation, msg):
+        kind = msg.get("type")
+        if generation != self._generation or kind == "CancelledError":
+            return  # Закрытие старого сокета после переоткрытия
+        if kind in RECOVERABLE_ERRORS:
+            # Обрыв соединения: python-binance переподключается к тем же потокам сам
+            logger.warning(f"WebSocket: {kind}: {msg.get('m')}")
+            return
+        if not self._broken:
+            logger.error(f"Ошибка WebSocket: {kind}: {msg.get('m')}; соединение будет открыто заново")
+            stream_reconnects.inc("socket")
+            self._broken = True
+            self._generation += 1  # Дальнейшие ошибки сломанного слушателя игнорируются
+            self._fresh = True
+            self._wake.set()
+
+
+stream_manager = StreamManager()
@@ -0,0 +1,189 @@
+"""
+Подбор параметров сигналов на локальной истории: перебор сетки (или случайных
+точек из неё) по всем ядрам. Свечи лежат в общей памяти (SharedMemory):
+процессы читают одни и те же массивы, в задачи уходят только параметры.
+
+    python app/sweep.py BTCUSDT:1m --strategy crash_reversal
+    python app/sweep.py data/btc_1m.csv --strategy combined --samples 2000 --sort max_drawdown_pct
+    python app/sweep.py BTCUSDT:15m --strategy combined --grid '{"window": [14, 20], "oversold": [25, 30]}'
+"""
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import sys
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from backtest import load_candles, run_backtest
+
+# Сетки по умолчанию: значения, вручную выбранные в боте, плюс соседние
+GRIDS = {
+    "crash_reversal": {
+        "drop_threshold": [0.5, 1, 2, 3, 5, 7, 10],
+        "period": [5, 10, 15, 20, 30],
+        "volume_multiplier": [1.0, 1.25, 1.5, 2.0, 3.0],
+        "hold": [15, 30, 60, 120, 240],
+    },
+    "combined": {
+        "window": [10, 14, 20, 30, 50],
+        "std_dev": [1.5, 2, 2.5, 3],
+        "periods": [7, 14, 21],
+        "oversold": [20, 25, 30, 35],
+        "overbought": [65, 70, 75, 80],
+    },
+    "auto_sell": {
+        "take_profit": [0.005, 0.01, 0.02, 0.03],
+        "confirm": [5, 10, 20],
+        "min_rise": [0.0005, 0.001, 0.002],
+        "drop_threshold": [1, 3, 5],
+        "period": [10, 20],
+        "volume_multiplier": [1.5, 2.0],
+    },
+}
+
+SHARED_COLUMNS = ("open", "high", "low", "close", "volume")
+ASCENDING = {"max_drawdown_pct"}  # Для этих метрик меньше — лучше
+
+_candles = None  # В процессе-воркере: колонки-представления общей памяти
+_shm = None
+
+
+def combinations(grid, samples=None, seed=0):
+    """Все точки сетки или samples случайных без повторов"""
+    names = list(grid)
+    total = math.prod(len(values) for values in grid.values())
+    if samples is None or samples >= total:
+        indices = range(total)
+    else:
+        indices = sorted(random.Random(seed).sample(range(total), samples))
+    result = []
+    for index in indices:
+        params = {}
+        # Последний параметр меняется быстрее всех, как в itertools.product
+        for name in reversed(names):
+            index, i = divmod(index, len(grid[name]))
+            params[name] = grid[name][i]
+        result.append({name: params[name] for name in names})
+    return result
+
+
+def share_candles(candles):
+    """Копирует колонки свечей в один блок общей памяти: (блок, колонки, длина)"""
+    columns = [name for name in SHARED_COLUMNS if name in candles]
+    length = len(candles["close"])
+    shm = shared_memory.SharedMemory(create=True, size=max(len(columns) * length * 8, 1))
+    block = np.ndarray((len(columns), length), dtype=np.float64, buffer=shm.buf)
+    for row, name in enumerate(columns):
+        block[row] = candles[name]
+    return shm, columns, length
+
+
+def _attach(name, columns, length):
+    """Инициализатор воркера: подключается к общей памяти без копирования"""
+    global _candles, _shm
+    _shm = shared_memory.SharedMemory(name=name)
+    block = np.ndarray((len(columns), length), dtype=np.float64, buffer=_shm.buf)
+    _candles = {column: block[row] for row, column in enumerate(columns)}
+
+
+def _evaluate(strategy, fee, slippage, batch):
+    results = []
+    for params in batch:
+        with np.errstate(all="ignore"):
+            report = run_backtest(_candles, strategy, fee, slippage, **params)
+        results.append(dict(params, **report))
+    return results
+
+
+def sweep(candles, strategy, grid, samples=None, workers=None, fee=0.001, slippage=0.0005, progress=True):
+    """
+    Прогоняет бэктест для каждой точки сетки в пуле процессов.
+    :return: список отчётов run_backtest с параметрами, в порядке сетки
+    """
+    points = combinations(grid, samples)
+    workers = workers or os.cpu_count() or 1
+    # Пачки по несколько точек: меньше накладных расходов на задачу, соседние точки делят кэш процессора
+    batch_size = max(1, min(50, len(points) // (workers * 8)))
+    batches = [points[i:i + batch_size] for i in range(0, len(points), batch_size)]
+
+    shm, columns, length = share_candles(candles)
+    results = []
+    started = time.monotonic()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                                    initargs=(shm.name, columns, length)) as pool:
+            futures = [pool.submit(_evaluate, strategy, fee, slippage, batch) for batch in batches]
+            for done, future in enumerate(futures, 1):
+                results.extend(future.result())
+                if progress:
+                    elapsed = time.monotonic() - started
+                    print(f"\r{len(results)}/{len(points)} комбинаций, {elapsed:.0f} с "
+                          f"(осталось ~{elapsed / done * (len(futures) - done):.0f} с)", end="", file=sys.stderr)
+    finally:
+        shm.close()
+        shm.unlink()
+    if progress:
+        print(file=sys.stderr)
+    return results
+
+
+def rank(results, sort="pnl_pct", min_trades=1):
+    """Результаты с достаточным числом сделок, лучшие первыми"""
+    ranked = [r for r in results if r["trades"] >= min_trades]
+    ranked.sort(key=lambda r: r[sort], reverse=sort not in ASCENDING)
+    return ranked
+
+
+def format_table(results, params, top=20):
+    header = ["#"] + params + ["PnL %", "просадка %", "прибыльных %", "сделок", "в позиции %"]
+    rows = [[str(i)] + [str(r[name]) for name in params] +
+            [f"{r['pnl_pct']:.2f}", f"{r['max_drawdown_pct']:.2f}", f"{r['win_rate_pct']:.1f}", str(r["trades"]),
+             f"{r['exposure_pct']:.1f}"]
+            for i, r in enumerate(results[:top], 1)]
+    widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+    lines = ["  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор параметров сигналов на локальной истории")
+    parser.add_argument("path", help="CSV в формате Binance, .npz со свечами или SYMBOL:interval из хранилища")
+    parser.add_argument("--strategy", choices=sorted(GRIDS), default="crash_reversal")
+    parser.add_argument("--grid", help="Своя сетка в JSON: {параметр: [значения]}; дополняет сетку по умолчанию")
+    parser.add_argument("--samples", type=int, help="Случайный поиск: столько точек сетки вместо полного перебора")
+    parser.add_argument("--workers", type=int, help="Процессов (по умолчанию — по числу ядер)")
+    parser.add_argument("--sort", default="pnl_pct",
+                        choices=["pnl_pct", "max_drawdown_pct", "win_rate_pct", "trades", "exposure_pct"])
+    parser.add_argument("--min-trades", type=int, default=5, help="Не ранжировать комбинации с меньшим числом сделок")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--slippage", type=float, default=0.0005)
+    parser.add_argument("--out", help="Сохранить все результаты в JSON")
+    args = parser.parse_args()
+
+    grid = dict(GRIDS[args.strategy])
+    if args.grid:
+        grid.update(json.loads(args.grid))
+    candles = load_candles(args.path)
+    points = math.prod(len(values) for values in grid.values())
+    print(f"Свечей: {len(candles['close'])}, комбинаций: {min(points, args.samples or points)} из {points}",
+          file=sys.stderr)
+
+    started = time.monotonic()
+    results = sweep(candles, args.strategy, grid, args.samples, args.workers, args.fee, args.slippage)
+    ranked = rank(results, args.sort, args.min_trades)
+    print(format_table(ranked, list(grid), args.top))
+    print(f"\n{len(results)} комбинаций за {time.monotonic() - started:.1f} с, "
+          f"с не меньше чем {args.min_trades} сделками: {len(ranked)}", file=sys.stderr)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"strategy": args.strategy, "path": args.path, "grid": grid, "sort": args.sort,
+                       "results": rank(results, args.sort, 0)}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
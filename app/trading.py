@@ -1,175 +1,226 @@
-from binance.client import Client
-import pandas as pd
-import numpy as np
 import asyncio
-import concurrent.futures
 import time
+import exchange
+from kline_cache import kline_cache
 from database import log_to_db
-from notifications import send_telegram_notification
-from binance import ThreadedWebsocketManager
-from config import API_KEY, API_SECRET, SYMBOL, AMOUNT
+from streams import stream_manager
+from config import SYMBOL, AMOUNT
 from logger import logger
 from indicators import detect_crash_reversal
+from triggers import trigger_book, TAKE_PROFIT
+from trend import TrendConfirmer, SELL
+from order_router import order_router
+from coalesce import coalesce, invalidate
+from price_board import price_board
+from order_book import get_order_book
+from metrics import tick_handle_latency, tick_to_decision, trend_decision_latency, decisions_total, order_latency
+
+monitoring = False  # Флаг: есть активные триггеры авто-продажи
+ticker_subscription = None
+expiry_timer = None  # Таймер окончания ближайшего окна подтверждения тренда
+latest_price = None  # Глобальная переменная для хранения последней цены
 
-client = Client(API_KEY, API_SECRET)
+# Подтверждение тренда после тейк-профита: 10 секунд, рост меньше 0.1% — продаём
+trend_confirmer = TrendConfirmer(window=10.0, min_rise=0.001)
 
-monitoring = False  # Флаг отслеживания цены
-target_price = None
-ws_manager = None
-latest_price = None  # Глобальная переменная для хранения последней цены
 
+def start_ws_monitoring(price, chat_id=None, kind=TAKE_PROFIT, trail=None):
+    """
+    Добавляет триггер авто-продажи и подписывается на тикер через общее WebSocket-соединение.
+    Для трейлинг-стопа price — текущая цена, от которой отсчитывается откат trail.
+    Вызывать из event loop: тики обрабатываются в нём же.
+    """
+    trigger = trigger_book.add(SYMBOL, kind, price, chat_id=chat_id, trail=trail, current_price=price)
+    ensure_ws_monitoring()
+    return trigger
 
-def start_ws_monitoring(price):
-    """Запускает WebSocket для отслеживания цены через поток"""
-    global monitoring, target_price, ws_manager
-    target_price = float(price)
+
+def ensure_ws_monitoring():
+    """
+    Подписывается на тикер, если в книге есть триггеры (в том числе восстановленные из снимка).
+    Вызывать из event loop.
+    """
+    global monitoring, ticker_subscription
+    if not trigger_book.symbols():
+        return
     monitoring = True
+    if ticker_subscription is None:
+        ticker_subscription = stream_manager.subscribe(f"{SYMBOL.lower()}@ticker", callback=handle_ws_message,
+                                                       loop=asyncio.get_running_loop())
+
+
+def cancel_sell_triggers(chat_id, trigger_id=None):
+    """Отменяет один триггер чата или все его триггеры, возвращает отменённые"""
+    if trigger_id is None:
+        cancelled = trigger_book.cancel_chat(chat_id)
+    else:
+        trigger = next((t for t in trigger_book.list(chat_id) if t.id == trigger_id), None)
+        cancelled = [trigger_book.cancel(trigger_id)] if trigger else []
+    release_ws_monitoring()
+    return cancelled
 
-    # Запускаем WebSocket в отдельном потоке
-    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-    loop = asyncio.get_running_loop()
-    loop.run_in_executor(executor, start_ws)
 
-def start_ws():
-    """Запускает WebSocket в отдельном потоке"""
-    global ws_manager
-    ws_manager = ThreadedWebsocketManager()
-    ws_manager.start()
-    ws_manager.start_symbol_ticker_socket(callback=handle_ws_message, symbol=SYMBOL)
+def release_ws_monitoring():
+    """Отписывается от тикера, если не осталось ни триггеров, ни незавершённых подтверждений"""
+    if not trigger_book.symbols() and not len(trend_confirmer):
+        stop_ws_monitoring()
 
 
 def stop_ws_monitoring():
     """Останавливает WebSocket мониторинг"""
-    global monitoring, ws_manager
+    global monitoring, ticker_subscription, expiry_timer
     monitoring = False
 
-    if ws_manager:
-        ws_manager.stop()
-        ws_manager = None
+    if ticker_subscription:
+        stream_manager.unsubscribe(ticker_subscription)
+        ticker_subscription = None
+    if expiry_timer:
+        expiry_timer.cancel()
+        expiry_timer = None
 
-def handle_ws_message(msg):
-    """Обрабатывает входящие данные с Binance WebSocket"""
-    global monitoring, latest_price
+def handle_ws_message(msg, now=None):
+    """
+    Обрабатывает тикер из Binance WebSocket в event loop.
+    Пачки тиков схлопываются подпиской до последнего, задачи на тик не создаются:
+    триггеры проверяются по книге, тренд подтверждается по тем же тикам.
+    """
+    global latest_price
     if not monitoring:
         return
 
+    started = time.perf_counter()
     latest_price = float(msg["c"])  # Обновляем глобальную переменную
-    print(f"🔥 Текущая цена: {latest_price} USDT")
-
-    # Запускаем проверку в уже существующем loop
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        loop.create_task(check_sell_trigger(latest_price))
+    now = time.monotonic() if now is None else now
+
+    decisions = trend_confirmer.on_tick(SYMBOL, latest_price, now)
+    fired = trigger_book.on_price(SYMBOL, latest_price)
+    for trigger in fired:
+        print(f"🎯 Сработал триггер {trigger.describe()}")
+        if trigger.kind == TAKE_PROFIT:
+            # Тейк-профит: сначала убеждаемся, что рост закончился
+            trend_confirmer.start(trigger, latest_price, now)
+        else:
+            # Стопы продаём сразу
+            # place_order("SELL", trigger.quantity or AMOUNT)
+            log_to_db("SELL", f"Продажа BTC по {latest_price}, {trigger.describe()}")
+            decisions_total.inc(trigger.kind)
+
+    if decisions or fired:
+        apply_trend_decisions(decisions)
+
+    tick_handle_latency.observe(time.perf_counter() - started)
+    if "E" in msg:  # Время события на бирже, мс: сеть + очередь потока + обработка
+        tick_to_decision.observe(max(time.time() - msg["E"] / 1000, 0.0))
+
+def apply_trend_decisions(decisions):
+    """Исполняет решения по подтверждению тренда и переставляет таймер ближайшего окна"""
+    global expiry_timer
+    for decision in decisions:
+        decisions_total.inc(decision.action)
+        trend_decision_latency.observe(decision.latency)
+        if decision.action == SELL:  # Цена не пошла вверх на 0.1% — продаём
+            print(f"✅ Цена стабилизировалась, продаём по {decision.price}!")
+            # place_order("SELL", decision.trigger.quantity or AMOUNT)
+            log_to_db("SELL", f"Продажа BTC по {decision.price}, старт был {decision.start_price}, "
+                              f"{decision.trigger.describe()}")
+            # await send_telegram_notification(f"🚀 Авто-продажа! Продали BTC по {max_price} USDT!")
+        else:
+            print(f"❌ Цена ещё растёт, не продаём: {decision.trigger.describe()}")
+
+    if expiry_timer:
+        expiry_timer.cancel()
+        expiry_timer = None
+    deadline = trend_confirmer.next_deadline()
+    if deadline is not None:
+        # Если тиков нет, решение всё равно выносится ровно в конце окна
+        loop = asyncio.get_running_loop()
+        expiry_timer = loop.call_later(max(deadline - time.monotonic(), 0), expire_trend_windows)
     else:
-        asyncio.run(check_sell_trigger(latest_price))
-
-async def check_sell_trigger(price):
-    """Проверяет условия для продажи"""
-    global monitoring, target_price
-
-    if price >= target_price:
-        print(f"🎯 Цена достигла {target_price}, начинаем анализ тренда...")
-        await monitor_price_trend()
-
-async def monitor_price_trend():
-    """Следим за ценой 10 секунд и ищем момент максимума"""
-    global monitoring
-    max_price = None
-    start_price = get_latest_price()  # Запоминаем стартовую цену
-
-    for i in range(10):
-        await asyncio.sleep(1)
-        latest_price = get_latest_price()
-
-        # Запоминаем максимум за 10 секунд
-        if max_price is None or latest_price > max_price:
-            max_price = latest_price
+        release_ws_monitoring()
 
-        print(f"📊 [{i + 1}/10] Цена BTC: {latest_price}, макс: {max_price}")
-
-    if max_price < start_price * 1.001:  # Если цена не пошла вверх на 0.1%, продаём
-        print(f"✅ Цена стабилизировалась, продаём по {max_price}!")
-        # place_order("SELL", 0.001)
-        log_to_db("SELL", f"Продажа BTC по {max_price}, старт был {start_price}")
-        # await send_telegram_notification(f"🚀 Авто-продажа! Продали BTC по {max_price} USDT!")
-    else:
-        print(f"❌ Цена ещё растёт, ждём дальше.")
-        # await send_telegram_notification(f"⏳ Цена растёт, не продаём! Макс: {max_price} USDT")
-
-    stop_ws_monitoring()
-
-    # for _ in range(10):
-    #     await asyncio.sleep(1)
-    #     latest_price = get_latest_price()
-    #     if max_price is None or latest_price > max_price:
-    #         max_price = latest_price
-    #     else:
-    #         print(f"📉 Цена начала падать: {latest_price}, продаём!")
-    #         # place_order("SELL", 0.001)  # Продаём 0.001 BTC
-    #         log_to_db("SELL",f"Текущая цена BTC: {latest_price} Залочено {target_price}")
-    #         stop_ws_monitoring()
-    #         return
-    #
-    # print(f"⏳ 10 секунд прошло, продаём по {max_price}!")
-    # # place_order("SELL", 0.001)
-    # log_to_db("SELL", f"Текущая цена BTC: {max_price} Залочено {target_price}")
-    # stop_ws_monitoring()
+def expire_trend_windows():
+    """Срабатывает по таймеру в конце окна подтверждения"""
+    apply_trend_decisions(trend_confirmer.expire(time.monotonic()))
 
 def get_latest_price():
     """Получает текущую цену BTC (из WebSocket)"""
     return latest_price
-    # return float(ws_manager.tickers[SYMBOL]["c"])
 
-def get_price():
-    """Получаем текущую цену BTC"""
+async def get_price():
+    """Получаем текущую цену BTC: из табло цен, если она свежая, иначе по REST"""
+    price = price_board.price(SYMBOL)
+    if price is not None:
+        return price
+    return await fetch_price()
+
+@coalesce("price")
+async def _fetch_price():
+    return await exchange.get_price(SYMBOL)
+
+
+async def fetch_price():
+    """Цена BTC по REST"""
     try:
-        price = client.get_symbol_ticker(symbol=SYMBOL)["price"]
-        return float(price)
+        return await _fetch_price()
     except Exception as e:
         logger.error(f"Ошибка получения цены: {e}")
         return None
 
 
-def place_order(side, quantity = AMOUNT):
-    """Размещаем лимитный ордер"""
+def book_price(side, quantity=AMOUNT):
+    """
+    Цена лимитного ордера по локальной книге заявок: уровень, до которого ордер
+    на quantity исполнится целиком (BUY — по ask, SELL — по bid).
+    None, если книга не ведётся, не синхронизирована или в ней не хватает объёма.
+    """
+    book = get_order_book(SYMBOL)
+    if book is None:
+        return None
+    return book.fill_price(side, float(quantity))  # Из меню бота приходит Decimal
+
+
+async def submit_order(side, quantity=AMOUNT, price=None, chat_id=None):
+    """
+    Ставит лимитный ордер в очередь роутера и сразу возвращает заявку.
+    Без price ордер выставляется по книге заявок (см. book_price),
+    а если книги нет — по текущей цене (см. get_price).
+    Результат роутер отправит в chat_id.
+    """
+    if price is None:
+        price = book_price(side, quantity) or await get_price()
+        if not price:
+            raise ValueError("Нет текущей цены для ордера")
+    intent = order_router.submit(SYMBOL, side, quantity, price, chat_id=chat_id)
+    # После ордера баланс и список открытых ордеров меняются — кэш больше не годится
+    intent.future.add_done_callback(lambda _: invalidate("balance", "open_orders"))
+    intent.future.add_done_callback(lambda future: order_latency.observe(
+        time.monotonic() - intent.created, side,
+        "cancelled" if future.cancelled() else "error" if future.exception() else "ok"))
+    return intent
+
+
+async def place_order(side, quantity = AMOUNT):
+    """Размещаем лимитный ордер по книге заявок (или по текущей цене)"""
     try:
-        price = get_price()
-        if price:
-            order = client.create_order(
-                symbol=SYMBOL,
-                side=side,
-                type="LIMIT",
-                timeInForce="GTC",
-                quantity=quantity,
-                price=str(price),
-            )
-            logger.info(f"Ордер размещен: {order}")
-            return order
+        intent = await submit_order(side, quantity)
+        return await asyncio.shield(intent.future)  # Отмена ожидания не отменяет заявку
     except Exception as e:
         logger.error(f"Ошибка при размещении ордера: {e}")
         return None
 
 
-def make_order(side, quantity, price):
+async def make_order(side, quantity, price):
     try:
-        order = client.create_order(
-            symbol=SYMBOL,
-            side=side,
-            type="LIMIT",
-            timeInForce="GTC",
-            quantity=quantity,
-            price=str(price),
-        )
-        logger.info(f"Ордер размещен: {order}")
-        return order
+        intent = await submit_order(side, quantity, price)
+        return await asyncio.shield(intent.future)  # Отмена ожидания не отменяет заявку
     except Exception as e:
         logger.error(f"Ошибка при размещении ордера: {e}")
         return None
 
 
-def place_test_order(quantity, price):
+async def place_test_order(quantity, price):
     try:
-        order = client.create_test_order(
+        order = await exchange.create_test_order(
             symbol=SYMBOL,
             side="BUY",
             type="LIMIT",
@@ -184,10 +235,15 @@ def place_test_order(quantity, price):
         return None
 
 
-def get_open_orders():
+@coalesce("open_orders")
+async def _fetch_open_orders():
+    return await exchange.get_open_orders(SYMBOL)
+
+
+async def get_open_orders():
     """Получаем список открытых ордеров"""
     try:
-        orders = client.get_open_orders(symbol=SYMBOL)
+        orders = await _fetch_open_orders()
         logger.info(f"Открытые ордера: {orders}")
         return orders
     except Exception as e:
@@ -195,7 +251,7 @@ def get_open_orders():
         return []
 
 
-def fetch_historical_data(symbol: str, interval="1h", limit=100):
+async def fetch_historical_data(symbol: str, interval="1h", limit=100):
     """
     Получаем исторические данные с Binance.
     :param symbol: Торговая пара (например, "BTCUSDT").
@@ -203,20 +259,35 @@ def fetch_historical_data(symbol: str, interval="1h", limit=100):
     :param limit: Количество свечей для анализа.
     :return: DataFrame с историческими данными.
     """
-    klines = client.get_klines(symbol=symbol, interval=interval, limit=limit)
-    df = pd.DataFrame(klines, columns=["timestamp", "open", "high", "low", "close", "volume", "close_time",
-                                       "quote_asset_volume", "number_of_trades", "taker_buy_base", "taker_buy_quote",
-                                       "ignore"])
-    df["close"] = df["close"].astype(float)
-    df["volume"] = df["volume"].astype(float)
+    klines = await kline_cache.get(symbol, interval, limit)
+    return klines_to_frame(klines)
+
+
+async def fetch_candles(symbol: str, interval="1h", limit=100, columns=None):
+    """
+    Свечи без pandas: структурированный массив NumPy (см. candles.parse_klines).
+    Функции indicators принимают его напрямую.
+    :param columns: какие колонки разбирать, например ("close", "volume"); по умолчанию все
+    """
+    from candles import parse_klines  # ОТЛОЖЕННЫЙ ИМПОРТ: numpy
+    return parse_klines(await kline_cache.get(symbol, interval, limit), columns)
+
+
+def klines_to_frame(klines):
+    """DataFrame из сырых свечей Binance; все колонки числовые"""
+    import pandas as pd  # ОТЛОЖЕННЫЙ ИМПОРТ: pandas нужен только анализу, не старту бота
+    from candles import parse_klines
+    df = pd.DataFrame(parse_klines(klines))
+    df.columns = ["timestamp", "open", "high", "low", "close", "volume", "close_time", "quote_asset_volume",
+                  "number_of_trades", "taker_buy_base", "taker_buy_quote"]
     return df
 
 
-def check_market():
+async def check_market():
     """
     Проверяем рынок на резкое падение и возможный разворот.
     """
-    data = fetch_historical_data(SYMBOL, "15m", 50)  # Анализируем 50 свечей по 15 минут
+    data = await fetch_candles(SYMBOL, "15m", 50, ("close", "volume"))  # Анализируем 50 свечей по 15 минут
 
     if detect_crash_reversal(data):
         mes = "⚠ Обнаружен разворот после падения! Возможно, хорошая точка для входа в рынок."
@@ -226,7 +297,12 @@ def check_market():
         print("🚀 Никаких резких изменений, рынок стабилен.")
 
 
-def get_balance(asset: str) -> float:
+@coalesce("balance")
+async def _fetch_balance(asset):
+    return await exchange.get_balance(asset)
+
+
+async def get_balance(asset: str) -> float:
     """
     Получает баланс указанной валюты.
 
@@ -234,7 +310,7 @@ def get_balance(asset: str) -> float:
     :return: Баланс в виде числа с плавающей точкой
     """
     try:
-        balance = client.get_asset_balance(asset=asset)
+        balance = await _fetch_balance(asset)
         if balance:
             return float(balance["free"])
         return 0.0
@@ -243,14 +319,10 @@ def get_balance(asset: str) -> float:
         return 0.0
 
 
-def fetch_candlestick_data():
+async def fetch_candlestick_data():
     """
     Запрашиваем 15-минутные свечи BTC/USDT с Binance.
     """
-    klines = client.get_klines(symbol="BTCUSDT", interval=Client.KLINE_INTERVAL_15MINUTE, limit=50)
-
-    times = [int(entry[0]) for entry in klines]  # Время в миллисекундах
-    prices = [float(entry[4]) for entry in klines]  # Цена закрытия
-    times = np.array(times, dtype='datetime64[ms]')  # Преобразуем время
-
-    return times, prices
+    candles = await fetch_candles("BTCUSDT", "15m", 50, ("open_time", "close"))
+    times = candles["open_time"].astype('datetime64[ms]')  # Время открытия свечи
+    return times, candles["close"]
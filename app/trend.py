@@ -0,0 +1,127 @@
+import heapq
+from bisect import bisect_left
+from collections import deque
+from dataclasses import dataclass
+
+SELL = "sell"      # Рост закончился — продаём
+RISING = "rising"  # Цена продолжает расти — не продаём
+
+
+@dataclass
+class Decision:
+    trigger: object
+    action: str
+    price: float        # Максимум за окно наблюдения
+    start_price: float
+    started: float
+    decided: float
+
+    @property
+    def latency(self):
+        """Сколько прошло от срабатывания триггера до решения, сек"""
+        return self.decided - self.started
+
+
+class _Window:
+    """
+    Тики одного инструмента в монотонной очереди: цены строго убывают от головы к хвосту.
+    Максимум на любом суффиксе [t0, сейчас] — первый элемент с ts >= t0.
+    """
+
+    def __init__(self):
+        self.times = deque()
+        self.prices = deque()
+
+    def push(self, ts, price):
+        while self.prices and self.prices[-1] <= price:
+            self.prices.pop()
+            self.times.pop()
+        self.times.append(ts)
+        self.prices.append(price)
+
+    def evict(self, before):
+        while self.times and self.times[0] < before:
+            self.times.popleft()
+            self.prices.popleft()
+
+    def max_since(self, ts):
+        i = bisect_left(self.times, ts)
+        return self.prices[i] if i < len(self.prices) else None
+
+
+class TrendConfirmer:
+    """
+    Подтверждение тренда после срабатывания тейк-профита, управляемое тиками.
+    Правило как у прежнего monitor_price_trend: наблюдаем window секунд;
+    если цена выросла на min_rise от стартовой — тренд продолжается,
+    иначе продаём по максимуму окна. Рост фиксируется сразу на первом таком тике,
+    продажа — ровно в момент окончания окна (по тику или по таймеру).
+    """
+
+    def __init__(self, window=10.0, min_rise=0.001):
+        self.window = window
+        self.min_rise = min_rise
+        self._windows = {}     # symbol -> _Window
+        self._pending = {}     # trigger.id -> (trigger, start_price, started)
+        self._deadlines = []   # heap [(deadline, trigger.id)]
+        self._thresholds = {}  # symbol -> heap [(порог роста, trigger.id)]
+        self._watching = {}    # symbol -> число наблюдений
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self, trigger, price, now):
+        """Начинает наблюдение за трендом для сработавшего триггера"""
+        window = self._windows.setdefault(trigger.symbol, _Window())
+        window.push(now, price)
+        self._pending[trigger.id] = (trigger, price, now)
+        self._watching[trigger.symbol] = self._watching.get(trigger.symbol, 0) + 1
+        heapq.heappush(self._deadlines, (now + self.window, trigger.id))
+        heapq.heappush(self._thresholds.setdefault(trigger.symbol, []), (price * (1 + self.min_rise), trigger.id))
+
+    def next_deadline(self):
+        """Ближайший момент, когда нужно вынести решение без нового тика"""
+        while self._deadlines and self._deadlines[0][1] not in self._pending:
+            heapq.heappop(self._deadlines)
+        return self._deadlines[0][0] if self._deadlines else None
+
+    def expire(self, now):
+        """Решения по окнам, которые закончились к моменту now"""
+        decisions = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, trigger_id = heapq.heappop(self._deadlines)
+            pending = self._pending.pop(trigger_id, None)
+            if pending is None:
+                continue
+            trigger, start_price, started = pending
+            self._watching[trigger.symbol] -= 1
+            max_price = self._windows[trigger.symbol].max_since(started) or start_price
+            action = SELL if max_price < start_price * (1 + self.min_rise) else RISING
+            decisions.append(Decision(trigger, action, max_price, start_price, started, now))
+        return decisions
+
+    def on_tick(self, symbol, price, now):
+        """Обрабатывает тик, возвращает вынесенные решения"""
+        decisions = self.expire(now)
+        window = self._windows.get(symbol)
+        if window is None:
+            return decisions
+
+        window.push(now, price)
+        thresholds = self._thresholds.get(symbol)
+        while thresholds and thresholds[0][0] <= price:
+            _, trigger_id = heapq.heappop(thresholds)
+            pending = self._pending.pop(trigger_id, None)
+            if pending is not None:
+                trigger, start_price, started = pending
+                self._watching[symbol] -= 1
+                decisions.append(Decision(trigger, RISING, price, start_price, started, now))
+
+        if not self._watching.get(symbol):
+            # Никто больше не следит за инструментом — окно не нужно
+            del self._windows[symbol]
+            self._thresholds.pop(symbol, None)
+            self._watching.pop(symbol, None)
+        else:
+            window.evict(now - self.window)
+        return decisions
@@ -0,0 +1,287 @@
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, field, replace
+
+TAKE_PROFIT = "take_profit"  # Срабатывает, когда цена поднялась до уровня
+STOP = "stop"                # Срабатывает, когда цена опустилась до уровня
+TRAILING = "trailing"        # Стоп, который подтягивается за максимумом цены
+
+KIND_NAMES = {
+    TAKE_PROFIT: "тейк-профит",
+    STOP: "стоп",
+    TRAILING: "трейлинг-стоп",
+}
+
+
+@dataclass
+class Trigger:
+    id: int
+    symbol: str
+    kind: str
+    price: float              # Уровень срабатывания (для трейлинга — текущий уровень стопа)
+    chat_id: object = None
+    quantity: float = None
+    trail: float = None       # Для трейлинга: допустимый откат от максимума, доля (0.01 = 1%)
+    peak: float = None        # Для трейлинга: максимум цены с момента создания
+    created: float = field(default_factory=time.time)
+
+    def describe(self):
+        text = f"#{self.id} {KIND_NAMES[self.kind]} {self.symbol} {self.price:g}"
+        if self.kind == TRAILING:
+            text += f" (откат {self.trail * 100:g}% от {self.peak:g})"
+        return text
+
+
+class _TrailGroup:
+    """
+    Трейлинги с общим максимумом цены. Как только цена поднимается выше максимума
+    нескольких групп, их максимумы становятся одинаковыми, и группы сливаются в одну:
+    дальше рост цены обновляет одно число на группу, а не каждый триггер.
+    Уровень стопа триггера — peak * (1 - trail), первым срабатывает самый узкий откат.
+    """
+
+    __slots__ = ("peak", "seq", "trails")
+
+    def __init__(self, peak, seq):
+        self.peak = peak
+        self.seq = seq       # Для порядка в кучах при равных уровнях
+        self.trails = []     # [(trail, id)] по возрастанию; пустой список — группа слита или отработала
+
+    def stop(self):
+        """Ближайший уровень стопа в группе"""
+        return self.peak * (1 - self.trails[0][0])
+
+
+class _SymbolBook:
+    """Триггеры одного инструмента, разложенные по отсортированным структурам"""
+
+    def __init__(self):
+        self.take_profit = []  # [(price, id)] по возрастанию
+        self.stops = []        # [(price, id)] по возрастанию
+        self.trail_peaks = []  # min-heap [(максимум группы, seq, группа)]
+        self.trail_stops = []  # max-heap [(-ближайший стоп группы, seq, группа)]
+        self.trail_groups = 0  # Живые группы (в кучах бывают устаревшие записи)
+        self.trailing = 0      # Живые трейлинги
+
+    def __len__(self):
+        return len(self.take_profit) + len(self.stops) + self.trailing
+
+
+class TriggerBook:
+    """
+    Книга ценовых триггеров по многим инструментам.
+    На каждый тик находит сработавшие триггеры за O(log n + k):
+    тейк-профиты и стопы лежат в отсортированных списках (bisect),
+    трейлинги — группами с общим максимумом (см. _TrailGroup) в кучах с ленивым удалением.
+    У трейлингов peak и price в Trigger обновляются при чтении (list, export, срабатывание).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._books = {}     # symbol -> _SymbolBook
+        self._triggers = {}  # id -> Trigger
+        self._by_chat = {}   # chat_id -> {id}
+        self._groups = {}    # id трейлинга -> _TrailGroup
+        self._group_seq = itertools.count()
+
+    def __len__(self):
+        return len(self._triggers)
+
+    def add(self, symbol, kind, price=None, chat_id=None, quantity=None, trail=None, current_price=None):
+        """
+        Добавляет триггер.
+        Для трейлинга price не нужен: задаётся trail и текущая цена current_price,
+        от которой отсчитывается максимум.
+        """
+        with self._lock:
+            trigger_id = next(self._ids)
+            if kind == TRAILING:
+                if trail is None or not 0 < trail < 1:
+                    raise ValueError("Откат трейлинга должен быть больше 0 и меньше 100%")
+                trigger = Trigger(trigger_id, symbol, kind, current_price * (1 - trail), chat_id, quantity,
+                                  trail=trail, peak=current_price)
+            elif kind in (TAKE_PROFIT, STOP):
+                trigger = Trigger(trigger_id, symbol, kind, float(price), chat_id, quantity)
+            else:
+                raise ValueError(f"Неизвестный тип триггера: {kind}")
+            self._insert(trigger)
+            return trigger
+
+    def _insert(self, trigger):
+        book = self._books.setdefault(trigger.symbol, _SymbolBook())
+        if trigger.kind == TAKE_PROFIT:
+            insort(book.take_profit, (trigger.price, trigger.id))
+        elif trigger.kind == STOP:
+            insort(book.stops, (trigger.price, trigger.id))
+        else:
+            group = _TrailGroup(trigger.peak, next(self._group_seq))
+            group.trails.append((trigger.trail, trigger.id))
+            heapq.heappush(book.trail_peaks, (group.peak, group.seq, group))
+            heapq.heappush(book.trail_stops, (-group.stop(), group.seq, group))
+            self._groups[trigger.id] = group
+            book.trail_groups += 1
+            book.trailing += 1
+        self._triggers[trigger.id] = trigger
+        self._by_chat.setdefault(trigger.chat_id, set()).add(trigger.id)
+
+    def cancel(self, trigger_id):
+        """Удаляет триггер, возвращает его или None"""
+        with self._lock:
+            trigger = self._triggers.get(trigger_id)
+            if trigger is None:
+                return None
+            book = self._books[trigger.symbol]
+            if trigger.kind in (TAKE_PROFIT, STOP):
+                levels = book.take_profit if trigger.kind == TAKE_PROFIT else book.stops
+                i = bisect_left(levels, (trigger.price, trigger.id))
+                del levels[i]
+            else:
+                self._refresh(trigger)
+                group = self._groups[trigger.id]
+                i = bisect_left(group.trails, (trigger.trail, trigger.id))
+                del group.trails[i]
+                book.trailing -= 1
+                if not group.trails:
+                    book.trail_groups -= 1  # Записи группы в кучах отбросятся при следующем проходе
+                elif i == 0:
+                    heapq.heappush(book.trail_stops, (-group.stop(), group.seq, group))
+            self._forget(trigger)
+            return trigger
+
+    def cancel_chat(self, chat_id):
+        """Удаляет все триггеры чата"""
+        cancelled = []
+        for trigger_id in list(self._by_chat.get(chat_id, ())):
+            trigger = self.cancel(trigger_id)
+            if trigger is not None:
+                cancelled.append(trigger)
+        return cancelled
+
+    def list(self, chat_id=None, symbol=None):
+        with self._lock:
+            if chat_id is not None:
+                triggers = [self._triggers[i] for i in self._by_chat.get(chat_id, ())]
+            else:
+                triggers = list(self._triggers.values())
+            for trigger in triggers:
+                self._refresh(trigger)
+        if symbol is not None:
+            triggers = [t for t in triggers if t.symbol == symbol]
+        return sorted(triggers, key=lambda t: t.id)
+
+    def export(self):
+        """Копии всех триггеров для снимка (у трейлингов уровни меняются на тиках)"""
+        with self._lock:
+            for trigger in self._triggers.values():
+                self._refresh(trigger)
+            return [replace(trigger) for trigger in self._triggers.values()]
+
+    def restore(self, triggers):
+        """Возвращает в книгу триггеры из снимка с прежними id; новые id продолжают нумерацию"""
+        with self._lock:
+            for trigger in triggers:
+                if trigger.id not in self._triggers:
+                    self._insert(trigger)
+            self._ids = itertools.count(max(self._triggers, default=0) + 1)
+
+    def symbols(self):
+        with self._lock:
+            return [symbol for symbol, book in self._books.items() if len(book)]
+
+    def on_price(self, symbol, price):
+        """Обрабатывает новую цену, возвращает сработавшие триггеры (они удаляются из книги)"""
+        with self._lock:
+            book = self._books.get(symbol)
+            if book is None or not len(book):
+                return []
+            fired = []
+
+            if book.take_profit and book.take_profit[0][0] <= price:
+                k = bisect_right(book.take_profit, (price, float("inf")))
+                fired.extend(self._triggers[i] for _, i in book.take_profit[:k])
+                del book.take_profit[:k]
+
+            if book.stops and book.stops[-1][0] >= price:
+                k = bisect_left(book.stops, (price, -1))
+                fired.extend(self._triggers[i] for _, i in book.stops[k:])
+                del book.stops[k:]
+
+            if book.trailing:
+                fired.extend(self._update_trailing(book, price))
+
+            for trigger in fired:
+                self._forget(trigger)
+            return fired
+
+    def _update_trailing(self, book, price):
+        # Группы, чей максимум ниже текущей цены, получают максимум = price и сливаются в одну
+        merged = None
+        while book.trail_peaks and book.trail_peaks[0][0] < price:
+            peak, _, group = heapq.heappop(book.trail_peaks)
+            if not group.trails or group.peak != peak:
+                continue  # Устаревшая запись
+            if merged is None:
+                merged = group
+                continue
+            small, merged = sorted((group, merged), key=lambda g: len(g.trails))
+            for item in small.trails:
+                insort(merged.trails, item)
+                self._groups[item[1]] = merged
+            small.trails = []
+            book.trail_groups -= 1
+        if merged is not None:
+            merged.peak = price
+            heapq.heappush(book.trail_peaks, (price, merged.seq, merged))
+            heapq.heappush(book.trail_stops, (-merged.stop(), merged.seq, merged))
+
+        fired = []
+        while book.trail_stops and -book.trail_stops[0][0] >= price:
+            stop, _, group = heapq.heappop(book.trail_stops)
+            if not group.trails or group.stop() != -stop:
+                continue
+            trails = group.trails
+            k = 0
+            while k < len(trails) and group.peak * (1 - trails[k][0]) >= price:
+                k += 1
+            for _, trigger_id in trails[:k]:
+                trigger = self._triggers[trigger_id]
+                self._refresh(trigger)
+                fired.append(trigger)
+            del trails[:k]
+            book.trailing -= k
+            if trails:
+                heapq.heappush(book.trail_stops, (-group.stop(), group.seq, group))
+            else:
+                book.trail_groups -= 1
+
+        # Чистим кучи, если устаревших записей стало заметно больше живых
+        if len(book.trail_stops) + len(book.trail_peaks) > 4 * book.trail_groups + 128:
+            live = [group for peak, _, group in book.trail_peaks if group.trails and group.peak == peak]
+            book.trail_peaks = [(group.peak, group.seq, group) for group in live]
+            book.trail_stops = [(-group.stop(), group.seq, group) for group in live]
+            heapq.heapify(book.trail_peaks)
+            heapq.heapify(book.trail_stops)
+        return fired
+
+    def _refresh(self, trigger):
+        """Переносит в трейлинг текущий максимум его группы"""
+        group = self._groups.get(trigger.id)
+        if group is not None:
+            trigger.peak = group.peak
+            trigger.price = group.peak * (1 - trigger.trail)
+
+    def _forget(self, trigger):
+        self._triggers.pop(trigger.id, None)
+        self._groups.pop(trigger.id, None)
+        chat = self._by_chat.get(trigger.chat_id)
+        if chat is not None:
+            chat.discard(trigger.id)
+            if not chat:
+                del self._by_chat[trigger.chat_id]
+
+
+trigger_book = TriggerBook()